@@ -0,0 +1,157 @@
+# Alpha-beta search to the end of the current round.
+import math
+import time
+
+import numpy as np
+
+from constants import *
+import evaluation
+from zobrist import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
+
+class SearchTimeout(Exception):
+    pass
+
+def board_value(board):
+    # Score of board after end of round scoring plus the predicted endgame bonus
+    walls, line_tiles, line_nums, floor_counts, scores = evaluation.board_arrays(board)
+    scores = evaluation.score_round_batch(walls, line_tiles, line_nums, floor_counts, scores)
+    return float(scores[0] + evaluation.predicted_bonus_batch(walls, line_tiles, line_nums)[0])
+
+def evaluate(model):
+    # Value of model for model.next_player
+    player = model.next_player
+    return board_value(model.boards[player]) - board_value(model.boards[1 - player])
+
+class AlphaBeta_Player:
+    # Negamax alpha-beta search over the moves of the current round, which are
+    # deterministic once the factories are filled.  Leaves are the end of the
+    # round, or positions at the depth limit, scored by evaluate.
+    # Iterative deepening runs until time_limit seconds have passed, max_depth
+    # is reached, or a search reaches the end of the round on every line.
+    # Moves are ordered by the transposition table's best move and then by
+    # Heuristic_Player's batched move scores.  The children of nodes one move
+    # above the depth limit are all evaluated in one batch.
+    # The search is deterministic, rng is accepted like for every player and ignored.
+    def __init__(self, time_limit=1.0, max_depth=None, table_size=2**18, rng=None):
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.table = TranspositionTable(table_size)
+        self.last_stats = {}
+
+    def ordered_moves(self, model, first=None):
+        # Factories holding the same tiles lead to transpositions, only the
+        # first of them is searched
+        sources = model.tile_sources(unique=True)
+        moves = model.legal_moves(sources=sources)
+        scores = evaluation.move_scores(model, moves, sources=sources)
+        moves = [moves[i] for i in np.argsort(-scores, kind='stable')]
+        if first in moves:
+            moves.remove(first)
+            moves.insert(0, first)
+        return moves
+
+    def negamax(self, model, depth, alpha, beta):
+        self.nodes += 1
+        if time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        if model.round_over():
+            return evaluate(model)
+        if depth == 0:
+            self.reached_limit = True
+            return evaluate(model)
+        if depth == 1:
+            return self.frontier_value(model)
+        key = model.zobrist_hash()
+        entry = self.table.probe(key)
+        first = None
+        if entry:
+            first = entry.move
+            if entry.depth >= depth:
+                if entry.flag == EXACT:
+                    return entry.value
+                if entry.flag == LOWER_BOUND:
+                    alpha = max(alpha, entry.value)
+                else:
+                    beta = min(beta, entry.value)
+                if alpha >= beta:
+                    return entry.value
+        moves = self.ordered_moves(model, first)
+        if not moves:
+            return evaluate(model)
+        original_alpha = alpha
+        best_value, best_move = -math.inf, None
+        for move in moves:
+            undo = model.make_move(move)
+            value = -self.negamax(model, depth - 1, -beta, -alpha)
+            model.unmake_move(undo)
+            if value > best_value:
+                best_value, best_move = value, move
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+        if best_value <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_value >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.table.store(key, depth, best_value, flag, best_move)
+        return best_value
+
+    def frontier_value(self, model):
+        # Value of a node one move above the depth limit: the best of its
+        # children's values, evaluated together with evaluation.move_scores.
+        # The tile sources are listed once for the moves and their scores.
+        sources = model.tile_sources(unique=True)
+        moves = model.legal_moves(sources=sources)
+        if not moves:
+            return evaluate(model)
+        self.nodes += len(moves)
+        if len(sources) > 1 or sum(len(factory) > 0 for factory in model.factories) > 1:
+            # some children are not at the end of the round: another source
+            # is left, or a factory left out of sources as a duplicate
+            self.reached_limit = True
+        opponent = model.boards[1 - model.next_player]
+        values = evaluation.move_scores(model, moves, first_player_tile=True, sources=sources)
+        return float(values.max()) - board_value(opponent)
+
+    def search_root(self, model, depth, first):
+        # Return the best move and its value searching depth moves ahead
+        alpha, best_move = -math.inf, None
+        for move in self.ordered_moves(model, first):
+            undo = model.make_move(move)
+            value = -self.negamax(model, depth - 1, -math.inf, -alpha)
+            model.unmake_move(undo)
+            if value > alpha:
+                alpha, best_move = value, move
+        self.table.store(model.zobrist_hash(), depth, alpha, EXACT, best_move)
+        return best_move, alpha
+
+    def move(self, gamestate):
+        model = gamestate.copy()
+        model.zobrist_hash()
+        self.table.new_search()
+        self.nodes = 0
+        start = time.perf_counter()
+        self.deadline = start + self.time_limit if self.time_limit else math.inf
+        best_move, best_value, depth, exact = None, None, 0, False
+        while not exact and (self.max_depth is None or depth < self.max_depth):
+            self.reached_limit = False
+            try:
+                best_move, best_value = self.search_root(model, depth + 1, best_move)
+            except SearchTimeout:
+                break
+            depth += 1
+            exact = not self.reached_limit
+        if best_move is None:
+            # model may be left mid-search by the timeout
+            best_move = self.ordered_moves(gamestate)[0]
+        self.last_stats = {
+            'depth': depth,
+            'exact': exact,
+            'value': best_value,
+            'nodes': self.nodes,
+            'seconds': time.perf_counter() - start,
+            'table_hit_rate': self.table.hits / self.table.probes if self.table.probes else 0.0,
+        }
+        return best_move
@@ -0,0 +1,288 @@
+# Benchmarks for the model and player hot paths.
+# Usage: python benchmark.py [benchmark ...] [--json results.json] [--compare old.json]
+# Every benchmark reports rates (operations per second, higher is better)
+# on positions generated from a fixed seed.  --json writes them to a file
+# which --compare can check a later run against.
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from constants import *
+from model import Model, Move, Tile
+from basic_players import Random_Player, Heuristic_Player
+from parallel_mcts import Parallel_MCTS_Player
+from simulate import play_game
+from state import State
+import evaluation
+
+def seeded_positions(num_games=20, seed=0):
+    # Return a list of Models, one for every position reached in num_games
+    # games of random play.  The same seed always gives the same positions.
+    rng = np.random.default_rng(seed)
+    player = Random_Player(rng)
+    positions = []
+    for _ in range(num_games):
+        model = Model.start(rng)
+        while True:
+            model.setup_round()
+            while not model.round_over():
+                positions.append(State.from_model(model).to_model())
+                model.make_move(player.move(model))
+            model.cleanup_round()
+            if model.game_over():
+                break
+    return positions
+
+def legacy_possible_moves(gamestate):
+    # Move generation as Heuristic_Player did it before Model.legal_moves:
+    # try every candidate and check it with Model.is_valid_move.
+    moves = []
+    for factory_idx, factory in enumerate(gamestate.factories):
+        for tile in set(factory):
+            for line_idx in range(-1, 5):
+                move = Move(factory_idx, tile, line_idx)
+                if gamestate.is_valid_move(move, gamestate.next_player):
+                    moves.append(move)
+    for tile in set([t for t in gamestate.center if t != Tile.white]):
+        for line_idx in range(-1, 5):
+            move = Move(-1, tile, line_idx)
+            if gamestate.is_valid_move(move, gamestate.next_player):
+                moves.append(move)
+    return moves
+
+def legacy_predicted_bonus(board):
+    # Heuristic_Player's endgame bonus estimate before evaluation.predicted_bonus_batch
+    bonus = 0
+    for row in range(NUM_TILES):
+        capacity = NUM_TILES * (row+1)
+        num = np.sum(board.wall[row,:] != 0) * (row+1)
+        num += board.pattern_lines[row].num
+        bonus += ROW_BONUS*(num/capacity)**2
+    for col in range(NUM_TILES):
+        num = 0
+        for row in range(NUM_TILES):
+            if board.wall[row, col] != 0:
+                num += (row+1)
+            elif board.pattern_lines[row].tile:
+                tile_val = board.pattern_lines[row].tile.value
+                if (tile_val + row - 1) % 5 == col:
+                    num += board.pattern_lines[row].num
+        bonus += COLUMN_BONUS*(num/15)**2
+    for tile in list(Tile):
+        num = 0
+        for row in range(NUM_TILES):
+            if tile.value in board.wall[row]:
+                num += (row+1)
+            elif tile == board.pattern_lines[row].tile:
+                num += board.pattern_lines[row].num
+        bonus += ALL_TILES_BONUS*(num/15)**2
+    return bonus
+
+def legacy_move_score(move, gamestate):
+    # Heuristic_Player's move score before evaluation.move_scores: play the
+    # move on a copy of the board, score the round and add the bonus
+    board = gamestate.boards[gamestate.next_player].copy()
+    tiles = gamestate.center if move.from_center() else gamestate.factories[move.factory]
+    num_tiles = len([t for t in tiles if t == move.tile])
+    if move.to_floor_line():
+        board.add_to_floor_line(move.tile, num_tiles)
+    else:
+        board.add_to_pattern_line(move.pattern_line, move.tile, num_tiles)
+    board.score_round()
+    return board.score + legacy_predicted_bonus(board)
+
+def best_time(func, repeat, setup=None):
+    # Return the fastest of repeat runs of func, in seconds.
+    # setup is called untimed before every run and its result passed to func.
+    times = []
+    for _ in range(repeat):
+        args = (setup(),) if setup else ()
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def report(title, results, unit):
+    print(title)
+    for name, rate in results.items():
+        print("  {:<20} {:>14,.0f} {}/s".format(name, rate, unit))
+
+def bench_move_generation(positions, repeat):
+    num_moves = sum(len(position.legal_moves()) for position in positions)
+    assert num_moves == sum(len(legacy_possible_moves(position)) for position in positions)
+    player = Heuristic_Player()
+    results = {}
+    for name, generate in [
+            ('legacy', legacy_possible_moves),
+            ('legal_moves', Model.legal_moves),
+            ('possible_moves', lambda position: player.possible_moves(position))]:
+        # possible_moves leaves out moves from duplicate factories, every
+        # generator is rated by the moves it returns
+        generated = sum(len(generate(position)) for position in positions)
+        seconds = best_time(lambda: [generate(position) for position in positions], repeat)
+        results[name] = generated / seconds
+    report("move generation over {} positions, {} moves".format(len(positions), num_moves), results, 'moves')
+    print("  speedup              {:>14.2f}x".format(results['legal_moves'] / results['legacy']))
+    return results
+
+def bench_make_move(positions, repeat):
+    # make_move and unmake_move of every legal move of every position
+    moves = [(position, position.legal_moves()) for position in positions]
+    num_moves = sum(len(position_moves) for _, position_moves in moves)
+
+    def make_unmake():
+        for position, position_moves in moves:
+            for move in position_moves:
+                position.unmake_move(position.make_move(move))
+
+    def make_only(copies):
+        for position, move in copies:
+            position.make_move(move)
+
+    copies = lambda: [(position.copy(), move) for position, position_moves in moves for move in position_moves]
+    results = {
+        'make_move': num_moves / best_time(make_only, repeat, copies),
+        'make_unmake': num_moves / best_time(make_unmake, repeat),
+    }
+    report("make_move over {} moves".format(num_moves), results, 'moves')
+    return results
+
+def bench_board(positions, repeat):
+    # PlayerBoard.copy, score_round and tile_placement_score on the boards of every position
+    boards = [board for position in positions for board in position.boards]
+    cells = [(row, col) for row in range(5) for col in range(5)]
+    copies = lambda: [board.copy() for board in boards]
+    results = {
+        'copy': len(boards) / best_time(lambda: [board.copy() for board in boards], repeat),
+        'score_round': len(boards) / best_time(
+            lambda copies: [board.score_round() for board in copies], repeat, copies),
+        'tile_placement_score': len(boards) * len(cells) / best_time(
+            lambda: [board.tile_placement_score(row, col) for board in boards for row, col in cells],
+            repeat),
+    }
+    report("PlayerBoard over {} boards".format(len(boards)), results, 'calls')
+    return results
+
+def bench_heuristic_player(positions, repeat):
+    player = Heuristic_Player()
+    moves = [(position, player.possible_moves(position)) for position in positions]
+    for position, position_moves in moves:
+        assert np.allclose(evaluation.move_scores(position, position_moves),
+                           [legacy_move_score(move, position) for move in position_moves])
+    num_moves = sum(len(position_moves) for _, position_moves in moves)
+    results = {
+        'move': len(positions) / best_time(lambda: [player.move(position) for position in positions], repeat),
+        'legacy_move_score': num_moves / best_time(
+            lambda: [legacy_move_score(move, position) for position, position_moves in moves
+                     for move in position_moves], repeat),
+        'move_scores': num_moves / best_time(
+            lambda: [evaluation.move_scores(position, position_moves) for position, position_moves in moves],
+            repeat),
+    }
+    report("Heuristic_Player over {} positions".format(len(positions)), results, 'moves')
+    return results
+
+def bench_game(positions, repeat, num_games=5):
+    # Complete headless games between two heuristic players
+    def play():
+        rng = np.random.default_rng(0)
+        for _ in range(num_games):
+            play_game([Heuristic_Player(), Heuristic_Player()], Model.start(rng))
+    results = {'heuristic_vs_heuristic': num_games / best_time(play, max(repeat // 2, 1))}
+    report("{} headless games".format(num_games), results, 'games')
+    return results
+
+def bench_parallel_mcts(positions, repeat, time_limit=0.5, num_positions=4):
+    # Playouts per second of root and leaf parallel MCTS with the same per
+    # move time budget, from 1 worker up to one per core
+    positions = positions[::max(len(positions) // num_positions, 1)][:num_positions]
+    worker_counts = sorted(set([1, 2, 4, 8, 16, os.cpu_count()]))
+    worker_counts = [n for n in worker_counts if n <= os.cpu_count()]
+    results = {}
+    print("parallel MCTS, {} s per move over {} positions".format(time_limit, len(positions)))
+    for mode in ['root', 'leaf']:
+        for workers in worker_counts:
+            player = Parallel_MCTS_Player(workers=workers, mode=mode, time_limit=time_limit)
+            playouts = seconds = 0
+            for position in positions:
+                player.root = None
+                player.move(position)
+                playouts += player.last_stats['playouts']
+                seconds += player.last_stats['seconds']
+            player.close()
+            rate = results['{}_{}'.format(mode, workers)] = playouts / seconds
+            print("  {:<4} {:>3} workers {:>10,.0f} playouts/s  speedup {:.2f}x".format(
+                mode, workers, rate, rate / results['{}_1'.format(mode)]))
+    return results
+
+BENCHMARKS = {
+    'move_generation': bench_move_generation,
+    'make_move': bench_make_move,
+    'board': bench_board,
+    'heuristic_player': bench_heuristic_player,
+    'game': bench_game,
+    'parallel_mcts': bench_parallel_mcts,
+}
+# Benchmarks run when none are named; parallel_mcts takes long and depends on the core count
+DEFAULT_BENCHMARKS = [name for name in BENCHMARKS if name != 'parallel_mcts']
+
+def compare(results, old_results, threshold):
+    # Print the change of every rate against old_results.
+    # Return the names of the rates which dropped by more than threshold.
+    regressions = []
+    print("compared to previous results")
+    for name, rate in results.items():
+        if name not in old_results:
+            continue
+        change = rate / old_results[name] - 1
+        flag = ''
+        if change < -threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print("  {:<40} {:>+7.1%}{}".format(name, change, flag))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the model and player hot paths")
+    parser.add_argument('benchmarks', nargs='*', choices=[[]] + list(BENCHMARKS), default=[])
+    parser.add_argument('--games', type=int, default=20, help="games used to generate positions")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--compare', help="results file of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="slowdown reported as a regression by --compare (default 0.1)")
+    args = parser.parse_args()
+    positions = seeded_positions(args.games, args.seed)
+    results = {}
+    for name in args.benchmarks or DEFAULT_BENCHMARKS:
+        for metric, rate in BENCHMARKS[name](positions, args.repeat).items():
+            results['{}.{}'.format(name, metric)] = rate
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'meta': {
+                    'seed': args.seed,
+                    'games': args.games,
+                    'positions': len(positions),
+                    'repeat': args.repeat,
+                    'python': platform.python_version(),
+                    'numpy': np.__version__,
+                    'machine': platform.machine(),
+                    'cpus': os.cpu_count(),
+                },
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            old_results = json.load(f)['results']
+        if compare(results, old_results, args.threshold):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+# Bot client for server.py, playing games with a local computer player.
+# Usage: python client.py heuristic --opponent random --games 100 --concurrency 20
+#        [--host 127.0.0.1 --port 7777 | --unix /tmp/azul.sock]
+# Stands in for an external bot, e.g. to test the server or load it with
+# many games at once.
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from constants import *
+from players import PLAYERS, player_class
+from server import encode_move
+from state import State, STATE_DTYPE
+
+class RequestError(Exception):
+    # The server could not start a requested game
+    pass
+
+class Client:
+    # Plays games on one connection with new instances of player_cls.
+    # Moves are computed in the event loop, which is fine for fast players.
+    def __init__(self, reader, writer, player_cls, seed=None):
+        self.reader = reader
+        self.writer = writer
+        self.player_cls = player_cls
+        self.seed = np.random.SeedSequence(seed)
+        self.players = {}  # game id -> player
+        self.seats = {}    # game id -> seat played
+        self.requests = {} # request id -> future of the game id of a requested game
+        self.next_request = 0
+        self.results = {}  # game id -> future of its 'over' message
+        self.errors = []
+
+    @classmethod
+    async def connect(cls, player_cls, host='127.0.0.1', port=7777, unix=None, seed=None):
+        if unix is not None:
+            reader, writer = await asyncio.open_unix_connection(unix, limit=2**20)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=2**20)
+        client = cls(reader, writer, player_cls, seed)
+        client.task = asyncio.ensure_future(client.receive())
+        return client
+
+    async def send(self, message):
+        self.writer.write(json.dumps(message).encode() + b'\n')
+        await self.writer.drain()
+
+    async def play(self, opponent, seat=None):
+        # Play one game and return its 'over' message, with the seat played added
+        started = asyncio.get_running_loop().create_future()
+        request = self.next_request
+        self.next_request += 1
+        self.requests[request] = started
+        message = {'type': 'play', 'opponent': opponent, 'request': request}
+        if seat is not None:
+            message['seat'] = seat
+        await self.send(message)
+        game = await started
+        return await self.results[game]
+
+    async def receive(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                await self.handle(json.loads(line), loop)
+        finally:
+            for future in list(self.requests.values()) + list(self.results.values()):
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection to the server lost"))
+
+    async def handle(self, message, loop):
+        kind = message['type']
+        if kind == 'started':
+            game = message['game']
+            rng = np.random.default_rng(self.seed.spawn(1)[0])
+            self.players[game] = self.player_cls(rng=rng)
+            self.seats[game] = message['seat']
+            self.results[game] = loop.create_future()
+            self.requests.pop(message['request']).set_result(game)
+        elif kind == 'state':
+            game = message['game']
+            model = State(np.array(message['state'], dtype=STATE_DTYPE)).to_model()
+            move = self.players[game].move(model)
+            await self.send({'type': 'move', 'game': game, 'move': encode_move(move)})
+        elif kind == 'over':
+            game = message['game']
+            del self.players[game]
+            self.results.pop(game).set_result(dict(message, seat=self.seats.pop(game)))
+        elif kind == 'error':
+            self.errors.append(message['message'])
+            future = self.requests.pop(message.get('request'), None)
+            if future is not None:
+                future.set_exception(RequestError(message['message']))
+
+    async def close(self):
+        self.writer.close()
+        await self.task
+
+async def play_games(player_cls, opponent, games, concurrency, host='127.0.0.1', port=7777,
+                     unix=None, seed=None):
+    # Play games games with at most concurrency at once on one connection.
+    # Return the 'over' messages, with the client's seat added.  Seats
+    # alternate unless the opponent is a remote player who asked for one.
+    client = await Client.connect(player_cls, host, port, unix, seed)
+    semaphore = asyncio.Semaphore(concurrency)
+    async def one_game(i):
+        async with semaphore:
+            return await client.play(opponent, i % NUM_PLAYERS)
+    try:
+        return await asyncio.gather(*[one_game(i) for i in range(games)])
+    finally:
+        await client.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Play games on an Azul server with a local player")
+    parser.add_argument('player', help="one of: " + ", ".join(PLAYERS))
+    parser.add_argument('--opponent', default='heuristic',
+                        help="a player of the server, or 'remote' for another client")
+    parser.add_argument('-n', '--games', type=int, default=10)
+    parser.add_argument('-c', '--concurrency', type=int, default=10)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--unix', metavar='PATH', default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    try:
+        results = asyncio.run(play_games(
+            player_class(args.player), args.opponent, args.games, args.concurrency,
+            args.host, args.port, args.unix, args.seed))
+    except RequestError as e:
+        parser.exit(1, "Server refused the game: {}\n".format(e))
+    wins = sum(result['winner'] == result['seat'] for result in results)
+    own = np.mean([result['scores'][result['seat']] for result in results])
+    other = np.mean([result['scores'][1 - result['seat']] for result in results])
+    reasons = {}
+    for result in results:
+        reasons[result['reason']] = reasons.get(result['reason'], 0) + 1
+    print("{} games in {:.1f} s: {} won {:.1%}, score mean {:.1f} against {:.1f}, {}".format(
+        len(results), time.perf_counter() - start, args.player, wins / len(results), own, other,
+        ", ".join("{} {}".format(reason, count) for reason, count in sorted(reasons.items()))))
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,15 @@
+import time
+import tkinter.messagebox
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
 from model import Model, Tile, Move
-from view import View, PatternLines
+from view import View, PatternLines, ComputerGameDialog
 from constants import *
 from basic_players import Heuristic_Player
+from gamelog import GameLogWriter, GameRecorder
+from players import PLAYERS, close_player, computer_move, player_class
 
 def color_of_tile(test_tile):
     for color, tile in zip(TILE_COLORS, Tile):
@@ -14,136 +22,271 @@ def tile_of_color(test_color):
             return tile
 
 class Controller:
-    def __init__(self, root):
+    # If log_path is given, every finished game is appended to that game log.
+    # Computer moves are computed by a worker thread, or a worker process if
+    # processes is True, on a copy of the model while the GUI keeps running.
+    # The main loop checks for the result every poll_ms milliseconds.
+    # think_time is the time limit of computer players which have one.
+    # In computer vs computer games the next move starts move_delay
+    # milliseconds after the last one.  With no delay the window is redrawn
+    # at most every FRAME_MS milliseconds, skipping the moves in between.
+    POLL_MS = 10
+    FAST_POLL_MS = 1
+    FRAME_MS = 40
+    # name shown in the dialog: delay between moves in milliseconds
+    SPEEDS = {
+        "1 move/s": 1000,
+        "4 moves/s": 250,
+        "20 moves/s": 50,
+        "As fast as possible": 0,
+    }
+
+    def __init__(self, root, log_path=None, think_time=1.0, processes=False):
         self.model = Model.start()
+        self.log_path = log_path
+        self.recorder = None
+        self.think_time = think_time
+        self.executor = ProcessPoolExecutor(1) if processes else ThreadPoolExecutor(1)
+        # the computer player of every seat it plays
+        self.computer_players = {}
+        self.thinking = False
+        self.poll_ms = self.POLL_MS
+        self.move_delay = 0
+        # Increased for every new game, so moves computed for an earlier game are ignored
+        self.game = 0
+        self.drawn = {}
+        self.items = {}
+        self.last_render = 0.0
+        self.frame_pending = False
+        self.num_moves = 0
+        self.start_time = time.perf_counter()
         self.view = View(root)
         self.view.menu.add_vs_person_command(self.setup_pvp_game)
         self.view.menu.add_vs_computer_command(self.setup_pvc_game)
+        self.view.menu.add_computer_vs_computer_command(self.choose_computer_game)
 
-    def setup_pvp_game(self):
-        self.model = Model.start()
+    def new_model(self):
+        # Start a new game with a fresh seed, which the game log records
+        seed = np.random.SeedSequence().entropy
+        self.model = Model.start(np.random.default_rng(seed))
+        self.recorder = GameRecorder(seed=seed) if self.log_path else None
+        self.game += 1
+        self.thinking = False
+        self.close_players()
+        self.poll_ms = self.POLL_MS
+        self.move_delay = 0
+        self.num_moves = 0
+        self.start_time = time.perf_counter()
+        self.configure(self.view.status, text="")
         for board in self.view.boards:
             board.clear()
+        self.view.clear_selection()
+        self.reset_drawn()
+
+    def setup_pvp_game(self):
+        self.new_model()
+        for board in self.view.boards:
             board.add_pattern_lines_command(self.make_player_move)
             board.add_floor_line_command(self.make_player_move)
         self.setup_round()
+        self.render()
 
     def setup_pvc_game(self):
         # assume computer plays second for now
-        self.model = Model.start()
-        for board in self.view.boards:
-            board.clear()
+        self.new_model()
         board = self.view.boards[0]
         board.add_pattern_lines_command(self.make_player_move)
         board.add_floor_line_command(self.make_player_move)
-        self.computer_player = Heuristic_Player()
-        self.make_computer_move()
+        self.computer_players = {1: self.new_player(Heuristic_Player)}
         self.setup_round()
+        self.render()
+        self.start_computer_move()
 
-    def make_computer_move(self):
-        if self.model.next_player == 1:
-            move = self.computer_player.move(self.model)
-            self.make_move(move)
-        self.job = self.view.master.after(1000, self.make_computer_move)
+    def choose_computer_game(self):
+        ComputerGameDialog(self.view.master, list(PLAYERS), list(self.SPEEDS), self.setup_computer_game)
+
+    def setup_computer_game(self, player_names, speed):
+        # Computer vs computer game between the named players
+        try:
+            players = [self.new_player(player_class(name)) for name in player_names]
+        except (OSError, ValueError) as error:
+            tkinter.messagebox.showerror("Computer vs Computer", str(error))
+            return
+        self.new_model()
+        self.computer_players = dict(enumerate(players))
+        self.move_delay = self.SPEEDS[speed]
+        self.poll_ms = self.POLL_MS if self.move_delay else self.FAST_POLL_MS
+        self.setup_round()
+        self.render()
+        self.start_computer_move()
+
+    def close_players(self):
+        # Stop the computer players of the last game, e.g. their process pools
+        for player in self.computer_players.values():
+            close_player(player)
+        self.computer_players = {}
+
+    def new_player(self, cls):
+        player = cls()
+        if hasattr(player, 'time_limit'):
+            player.time_limit = self.think_time
+        return player
+
+    def start_computer_move(self, game=None):
+        # Hand the position to the worker if the computer is to move.
+        # game is given when the call was scheduled, see make_move.
+        if game is not None and game != self.game:
+            return
+        seat = self.model.next_player
+        if seat not in self.computer_players or self.thinking or self.model.round_over():
+            return
+        self.thinking = True
+        future = self.executor.submit(computer_move, self.computer_players[seat], self.model.copy())
+        self.view.master.after(self.poll_ms, self.finish_computer_move, future, self.game, seat)
+
+    def finish_computer_move(self, future, game, seat):
+        # Play the worker's move once it is ready
+        if game != self.game:
+            return
+        if not future.done():
+            self.view.master.after(self.poll_ms, self.finish_computer_move, future, game, seat)
+            return
+        self.thinking = False
+        move, self.computer_players[seat] = future.result()
+        self.make_move(move)
 
     def setup_round(self):
         self.model.setup_round()
-        self.fill_factories()
-        self.fill_center()
-        self.mark_player()
+        if self.recorder:
+            self.recorder.start_round(self.model)
 
     def cleanup_round(self):
         self.model.cleanup_round()
-        for player in range(2):
-            self.fill_floor_line(player)
-            self.update_score(player)
-            self.fill_wall(player)
-            for row in range(NUM_TILES):
-                self.fill_pattern_lines(player, row)
 
-    def fill_factories(self):
+    # Rendering.  self.drawn caches the options last given to every canvas
+    # item and widget, and configure only sends the options which changed,
+    # so a move costs one itemconfig per changed cell.  render draws the
+    # whole model that way and then refreshes the window once.
+    def reset_drawn(self):
+        # Forget what was drawn, e.g. after the view was cleared
+        self.drawn = {}
+
+    def configure(self, widget, item=None, **options):
+        drawn = self.drawn.setdefault((widget, item), {})
+        changed = {key: value for key, value in options.items() if drawn.get(key) != value}
+        if not changed:
+            return
+        if item is None:
+            widget.config(**changed)
+        else:
+            widget.itemconfig(item, **changed)
+        drawn.update(changed)
+
+    def tile_items(self, canvas):
+        if canvas not in self.items:
+            self.items[canvas] = canvas.find_withtag("tile")
+        return self.items[canvas]
+
+    def render(self, force=True):
+        # Draw the model.  Unless force is set, a frame less than FRAME_MS
+        # after the last one in a game without move delay is put off until
+        # FRAME_MS have passed, and moves played meanwhile are not drawn.
+        now = time.perf_counter()
+        if not force and not self.move_delay and now - self.last_render < self.FRAME_MS / 1000:
+            if not self.frame_pending:
+                self.frame_pending = True
+                self.view.master.after(self.FRAME_MS, self.render_pending_frame)
+            return
+        self.last_render = now
+        self.frame_pending = False
         for i in range(NUM_FACTORIES):
             self.fill_factory(i)
+        self.fill_center()
+        for player in range(NUM_PLAYERS):
+            for row in range(NUM_TILES):
+                self.fill_pattern_lines(player, row)
+            self.fill_floor_line(player)
+            self.fill_wall(player)
+            self.update_score(player)
+        self.mark_player()
+        self.update_status()
+        self.view.master.update_idletasks()
+
+    def render_pending_frame(self):
+        # A frame that was put off, unless another frame was drawn since
+        if self.frame_pending:
+            self.render()
+
+    def update_status(self):
+        # Moves per second of computer vs computer games
+        if len(self.computer_players) == NUM_PLAYERS and self.num_moves:
+            rate = self.num_moves / (time.perf_counter() - self.start_time)
+            self.configure(self.view.status, text="{} moves, {:.1f} moves/s".format(self.num_moves, rate))
 
     def fill_factory(self, factory_idx):
         tiles = self.model.factories[factory_idx]
         factory = self.view.centerboard.factories[factory_idx]
-        tile_indices = factory.find_withtag("tile")
-        for i in range(TILES_PER_FACTORY):
-            if i < len(tiles):
-                color = color_of_tile(tiles[i])
-            else:
-                color = BOARD_BG
-            factory.itemconfig(tile_indices[i], fill=color, width=1)
-        factory.update()
+        for i, idx in enumerate(self.tile_items(factory)):
+            color = color_of_tile(tiles[i]) if i < len(tiles) else BOARD_BG
+            self.configure(factory, idx, fill=color)
 
     def fill_center(self):
-        # update view
         center = self.view.centerboard.center
-        tile_indices = center.find_withtag("tile")
-        for i in range(18):
-            if i < len(self.model.center):
-                color = color_of_tile(self.model.center[i])
-            else:
-                color = BOARD_BG
-            center.itemconfig(tile_indices[i], fill=color)
-            center.itemconfig(tile_indices[i], width=1)
-        center.update()
+        for i, idx in enumerate(self.tile_items(center)):
+            color = color_of_tile(self.model.center[i]) if i < len(self.model.center) else BOARD_BG
+            self.configure(center, idx, fill=color)
 
     def fill_pattern_lines(self, player, pattern_line_idx):
-        board = self.view.boards[player]
+        canvas = self.view.boards[player].pattern_lines
         pattern_line = self.model.boards[player].pattern_lines[pattern_line_idx]
-        if pattern_line.tile:
-            color = color_of_tile(pattern_line.tile)
-        else:
-            color = BOARD_BG
-        num = pattern_line.num
-        board.pattern_lines.fill(pattern_line_idx, color, num)
-        board.pattern_lines.update()
+        color = color_of_tile(pattern_line.tile) if pattern_line.tile else BOARD_BG
+        indices = PATTERN_LINE_INDICES[pattern_line_idx]
+        # lines fill from the right
+        empty = len(indices) - pattern_line.num
+        for i, idx in enumerate(indices):
+            self.configure(canvas, idx, fill=BOARD_BG if i < empty else color)
 
     def fill_floor_line(self, player):
-        board = self.view.boards[player]
+        canvas = self.view.boards[player].floor_line
         floor_line = self.model.boards[player].floor_line
-        board.fill_floor_line([color_of_tile(tile) for tile in floor_line])
-        board.floor_line.update()
+        for i, idx in enumerate(self.tile_items(canvas)):
+            color = color_of_tile(floor_line[i]) if i < len(floor_line) else BOARD_BG
+            self.configure(canvas, idx, fill=color)
 
     def update_score(self, player):
         board = self.view.boards[player]
         score = self.model.boards[player].score
-        board.score_label.config(text="Player {}\nScore: {}".format(player, score))
-        board.score_label.update()
+        self.configure(board.score_label, text="Player {}\nScore: {}".format(player, score))
 
     def fill_wall(self, player):
-        board = self.view.boards[player]
+        canvas = self.view.boards[player].wall
         model_wall = self.model.boards[player].wall
-        tile_indices = board.wall.find_withtag("tile")
-        for row in range(NUM_TILES):
-            for col in range(NUM_TILES):
-                if model_wall[row, col] != 0:
-                    idx = tile_indices[row*NUM_TILES + col]
-                    board.wall.itemconfig(idx, stipple='', width=BOLD_WIDTH)
-        board.wall.update()
+        for i, idx in enumerate(self.tile_items(canvas)):
+            if model_wall[i // NUM_TILES, i % NUM_TILES] != 0:
+                self.configure(canvas, idx, stipple='', width=BOLD_WIDTH)
+            else:
+                self.configure(canvas, idx, stipple='gray25', width=1)
+
+    def save_game(self):
+        if self.recorder:
+            with GameLogWriter(self.log_path) as writer:
+                writer.write(self.recorder.finish(self.model))
+            self.recorder = None
 
     def mark_player(self):
         player = self.model.next_player
         for board in self.view.boards:
             if board.player_id == player:
-                board.config(highlightbackground="black")
-                board.config(highlightcolor="black")
-                board.config(highlightthickness=3)
+                self.configure(board, highlightbackground="black", highlightcolor="black",
+                               highlightthickness=3)
             else:
-                board.config(highlightthickness=0)
-            board.update()
+                self.configure(board, highlightthickness=0)
 
     def mark_winner(self):
-        for player in range(2):
-             self.update_score(player)
         for board in self.view.boards:
-            board.config(highlightthickness=0)
+            self.configure(board, highlightthickness=0)
         winner = self.model.winner()
-        winner_board = self.view.boards[winner]
-        winner_board.score_label.config(borderwidth=4)
-        winner_board.score_label.config(relief="ridge")
+        self.configure(self.view.boards[winner].score_label, borderwidth=4, relief="ridge")
 
     def selected_move(self, event, move_canvas):
         factory_idx = self.view.selected_factory()
@@ -162,23 +305,29 @@ class Controller:
         # move_line is the canvas (pattern_lines or floor_line) where the move is played
         move = self.selected_move(event, move_line)
         selected_board = move_line.master.player_id
+        if selected_board in self.computer_players:
+            return
         if self.model.is_valid_move(move, selected_board):
             self.make_move(move)
 
     def make_move(self, move):
-        player = self.model.next_player
+        if self.recorder:
+            self.recorder.record_move(move)
         self.model.make_move(move)
-        self.fill_factory(move.factory)
-        self.fill_center()
-        self.fill_pattern_lines(player, move.pattern_line)
-        self.fill_floor_line(player)
+        self.num_moves += 1
+        self.view.clear_selection()
         if self.model.round_over():
             self.cleanup_round()
             if self.model.game_over():
                 self.model.score_endgame()
+                self.save_game()
+                self.render()
                 self.mark_winner()
-                if hasattr(self, "job"):
-                    self.view.master.after_cancel(self.job)
-            else:
-                self.setup_round()
-        self.mark_player()
\ No newline at end of file
+                self.close_players()
+                return
+            self.setup_round()
+        self.render(force=False)
+        if self.move_delay:
+            self.view.master.after(self.move_delay, self.start_computer_move, self.game)
+        else:
+            self.start_computer_move()
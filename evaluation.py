@@ -0,0 +1,124 @@
+# Batched board evaluation with NumPy.
+# A batch of M player boards is a tuple of arrays
+#   walls        (M, NUM_TILES, NUM_TILES) tile values, 0 where empty
+#   line_tiles   (M, NUM_TILES) tile value on each pattern line, 0 if empty
+#   line_nums    (M, NUM_TILES) number of tiles on each pattern line
+#   floor_counts (M,) number of tiles on the floor line
+#   scores       (M,)
+# so that scoring and evaluating every candidate move of a position is one
+# set of array operations instead of a Python loop per board.
+import numpy as np
+
+from constants import *
+import model
+from model import Tile
+
+ROWS = np.arange(NUM_TILES)
+CAPACITIES = ROWS + 1
+BITS = 1 << ROWS
+
+# RUN_LENGTH[mask, pos], see model.RUN_LENGTH
+RUN_LENGTH = np.array(model.RUN_LENGTH)
+
+# FLOOR_PENALTY[n] is the total penalty for n tiles on the floor line
+FLOOR_PENALTY = np.array([sum(FLOOR_PENALTIES[:n]) for n in range(FLOOR_CAPACITY+1)])
+
+# Wall column of each tile value on each row, tile values start at 1
+WALL_COLUMN = (np.arange(NUM_TILES+1)[:, None] + ROWS[None, :] - 1) % NUM_TILES
+
+def board_arrays(board):
+    # Return a batch of one board from a model.PlayerBoard
+    return (
+        np.array(board.wall)[None],
+        np.array([[line.tile.value if line.tile else 0 for line in board.pattern_lines]]),
+        np.array([[line.num for line in board.pattern_lines]]),
+        np.array([len(board.floor_line)]),
+        np.array([board.score]))
+
+def candidate_boards(gamestate, moves, first_player_tile=False, sources=None):
+    # Return the batch of boards of gamestate.next_player after each of moves,
+    # before end of round scoring.  Like benchmark.legacy_move_score this
+    # ignores the first player tile unless first_player_tile is True.
+    # sources is gamestate.tile_sources() if the caller has it already, with
+    # unique=True if moves leave out the duplicate factories too.
+    walls, line_tiles, line_nums, floor_counts, scores = board_arrays(
+        gamestate.boards[gamestate.next_player])
+    num_moves = len(moves)
+    walls = np.repeat(walls, num_moves, axis=0)
+    line_tiles = np.repeat(line_tiles, num_moves, axis=0)
+    line_nums = np.repeat(line_nums, num_moves, axis=0)
+    floor_counts = np.repeat(floor_counts, num_moves, axis=0)
+    scores = np.repeat(scores, num_moves, axis=0)
+
+    if sources is None:
+        sources = gamestate.tile_sources()
+    counts = {(factory_idx, tile): count for factory_idx, tile, count in sources}
+    num_tiles = np.array([counts[move.factory, move.tile] for move in moves])
+    tiles = np.array([move.tile.value for move in moves])
+    lines = np.array([move.pattern_line for move in moves])
+    if first_player_tile and Tile.white in gamestate.center:
+        floor_counts[np.array([move.from_center() for move in moves], dtype=bool)] += 1
+
+    to_floor = lines == -1
+    floor_counts[to_floor] += np.clip(
+        FLOOR_CAPACITY - floor_counts[to_floor], 0, num_tiles[to_floor])
+    idx = np.nonzero(~to_floor)[0]
+    rows = lines[idx]
+    added = np.minimum(num_tiles[idx], CAPACITIES[rows] - line_nums[idx, rows])
+    line_nums[idx, rows] += added
+    line_tiles[idx, rows] = tiles[idx]
+    floor_counts[idx] += num_tiles[idx] - added
+    return walls, line_tiles, line_nums, floor_counts, scores
+
+def score_round_batch(walls, line_tiles, line_nums, floor_counts, scores):
+    # End of round scoring for a batch of boards, like PlayerBoard.score_round.
+    # Full pattern lines move to the wall and the floor lines are emptied.
+    # The arrays are updated in place and the new scores returned.
+    round_scores = np.zeros(len(scores), dtype=int)
+    for row in range(NUM_TILES):
+        idx = np.nonzero(line_nums[:, row] == row+1)[0]
+        if not len(idx):
+            continue
+        tiles = line_tiles[idx, row]
+        cols = WALL_COLUMN[tiles, row]
+        walls[idx, row, cols] = tiles
+        filled = walls[idx] != 0
+        row_masks = filled[:, row, :] @ BITS
+        col_masks = filled[np.arange(len(idx)), :, cols] @ BITS
+        row_connected = RUN_LENGTH[row_masks, cols]
+        col_connected = RUN_LENGTH[col_masks, row]
+        round_scores[idx] += np.where(
+            row_connected == 1, col_connected,
+            np.where(col_connected == 1, row_connected, row_connected + col_connected))
+        line_tiles[idx, row] = 0
+        line_nums[idx, row] = 0
+    round_scores += FLOOR_PENALTY[np.minimum(floor_counts, FLOOR_CAPACITY)]
+    floor_counts[:] = 0
+    scores[:] = np.maximum(scores + round_scores, 0)
+    return scores
+
+def predicted_bonus_batch(walls, line_tiles, line_nums):
+    # Heuristic_Player's endgame bonus estimate for a batch of boards, see
+    # benchmark.legacy_predicted_bonus.
+    # progress[m, row, col] is row+1 for a filled wall cell, or the number of
+    # tiles on the pattern line of row headed for that cell.
+    filled = walls != 0
+    line_cols = WALL_COLUMN[line_tiles, ROWS]
+    targets = (line_cols[:, :, None] == ROWS) & (line_tiles != 0)[:, :, None]
+    progress = np.where(filled, CAPACITIES[:, None], np.where(targets, line_nums[:, :, None], 0))
+    row_nums = filled.sum(axis=2) * CAPACITIES + line_nums
+    col_nums = progress.sum(axis=1)
+    color_nums = progress[:, ROWS[None, :], WALL_COLUMN[1:]].sum(axis=2)
+    total = NUM_TILES * (NUM_TILES + 1) / 2
+    return (
+        ROW_BONUS * ((row_nums / (NUM_TILES * CAPACITIES))**2).sum(axis=1)
+        + COLUMN_BONUS * ((col_nums / total)**2).sum(axis=1)
+        + ALL_TILES_BONUS * ((color_nums / total)**2).sum(axis=1))
+
+def move_scores(gamestate, moves, first_player_tile=False, sources=None):
+    # Heuristic_Player's score of every move in moves: the board's score after
+    # end of round scoring plus its predicted endgame bonus
+    walls, line_tiles, line_nums, floor_counts, scores = candidate_boards(
+        gamestate, moves, first_player_tile, sources)
+    score_round_batch(walls, line_tiles, line_nums, floor_counts, scores)
+    return scores + predicted_bonus_batch(walls, line_tiles, line_nums)
@@ -0,0 +1,132 @@
+# Fixed-size feature vectors of positions for learned evaluations.
+# Features are seen from the player to move: the OWN block describes that
+# player's board, the OPP block the other player's.  A player block holds
+#   wall         NUM_TILES*NUM_TILES cells, 1 where a tile is placed
+#   lines        NUM_TILES rows by NUM_TILES colors, the fraction of the
+#                row's capacity filled with that color
+#   floor        number of colored tiles on the floor line
+#   first player 1 if the first player tile is on the floor line
+#   score
+#   round score  the score after end of round scoring of the board as it is
+#   bonus        evaluation.predicted_bonus_batch of the board after that
+# followed by shared blocks for the tiles of every color in all factories,
+# in the center, in the draw pile and in the discard pile, whether the first
+# player tile is still in the center, and a constant bias of 1.
+# Encoders work on stacked State arrays and write into preallocated buffers,
+# so a batch of positions is encoded with a few array operations.
+import numpy as np
+
+from constants import *
+import evaluation
+from state import (State, STATE_SIZE, STATE_DTYPE, PLAYER_SIZE, WALL, LINE_TILE,
+                   LINE_NUM, FLOOR, SCORE, FACTORIES, CENTER, BAG, LID, NEXT_PLAYER,
+                   player_offset)
+
+assert NUM_PLAYERS == 2, "Features describe two players"
+
+# Layout of a player block
+F_WALL = 0
+F_LINES = F_WALL + NUM_TILES*NUM_TILES
+F_FLOOR = F_LINES + NUM_TILES*NUM_TILES
+F_FIRST_PLAYER = F_FLOOR + 1
+F_SCORE = F_FIRST_PLAYER + 1
+F_ROUND_SCORE = F_SCORE + 1
+F_BONUS = F_ROUND_SCORE + 1
+PLAYER_FEATURES = F_BONUS + 1
+
+# Layout of a feature vector
+OWN = 0
+OPP = OWN + PLAYER_FEATURES
+FACTORY_COLORS = OPP + PLAYER_FEATURES
+CENTER_COLORS = FACTORY_COLORS + NUM_TILES
+CENTER_FIRST_PLAYER = CENTER_COLORS + NUM_TILES
+BAG_COLORS = CENTER_FIRST_PLAYER + 1
+LID_COLORS = BAG_COLORS + NUM_TILES
+BIAS = LID_COLORS + NUM_TILES
+NUM_FEATURES = BIAS + 1
+
+FEATURE_DTYPE = np.float32
+
+COLOR_VALUES = np.arange(1, NUM_TILES+1)
+LINE_SCALE = 1.0 / (np.arange(NUM_TILES) + 1)
+
+class Encoder:
+    # Encodes batches of up to capacity positions into self.out.  The
+    # returned features are a view of self.out, valid until the next call.
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.states = np.zeros((capacity, STATE_SIZE), dtype=STATE_DTYPE)
+        self.players = np.empty((capacity, NUM_PLAYERS, PLAYER_SIZE), dtype=STATE_DTYPE)
+        self.board_features = np.empty((NUM_PLAYERS * capacity, PLAYER_FEATURES), dtype=FEATURE_DTYPE)
+        self.fills = np.empty((NUM_PLAYERS * capacity, NUM_TILES, NUM_TILES), dtype=FEATURE_DTYPE)
+        self.out = np.empty((capacity, NUM_FEATURES), dtype=FEATURE_DTYPE)
+
+    def reserve(self, n):
+        # Grow the buffers to hold at least n positions
+        if n > self.capacity:
+            self.__init__(max(n, 2 * self.capacity))
+
+    def encode(self, states):
+        # Features of the rows of a (n, STATE_SIZE) array of State data
+        n = len(states)
+        self.reserve(n)
+        out = self.out[:n]
+        players = self.players[:n]
+        first = states[:, NEXT_PLAYER, None] == 0
+        # players[:, 0] is the player to move, players[:, 1] the other one
+        for i, p in enumerate([first, ~first]):
+            np.copyto(players[:, i], states[:, player_offset(0):player_offset(1)], where=p)
+            np.copyto(players[:, i], states[:, player_offset(1):player_offset(2)], where=~p)
+        # The features of both players are computed as one batch of boards.
+        # A player whose board is the same in every position, like the
+        # opponent in the positions after each move from one position, is
+        # evaluated once.
+        same = [n > 1 and bool((players[1:, i] == players[0, i]).all()) for i in range(NUM_PLAYERS)]
+        boards = np.concatenate([players[:1, i] if same[i] else players[:, i] for i in range(NUM_PLAYERS)])
+        m = len(boards)
+        board_features = self.board_features[:m]
+        np.minimum(boards[:, WALL:LINE_TILE], 1, out=board_features[:, F_WALL:F_LINES])
+        fills = self.fills[:m]
+        np.equal(boards[:, LINE_TILE:LINE_NUM, None], COLOR_VALUES, out=fills)
+        fills *= (boards[:, LINE_NUM:FLOOR] * LINE_SCALE)[:, :, None]
+        board_features[:, F_LINES:F_FLOOR] = fills.reshape(m, -1)
+        np.sum(boards[:, FLOOR:FLOOR+NUM_TILES], axis=1, out=board_features[:, F_FLOOR])
+        board_features[:, F_FIRST_PLAYER] = boards[:, FLOOR+NUM_TILES]
+        board_features[:, F_SCORE] = boards[:, SCORE]
+        walls = boards[:, WALL:LINE_TILE].reshape(m, NUM_TILES, NUM_TILES)
+        line_tiles = boards[:, LINE_TILE:LINE_NUM].copy()
+        line_nums = boards[:, LINE_NUM:FLOOR].copy()
+        board_features[:, F_ROUND_SCORE] = evaluation.score_round_batch(
+            walls, line_tiles, line_nums, boards[:, FLOOR:SCORE].sum(axis=1), boards[:, SCORE])
+        board_features[:, F_BONUS] = evaluation.predicted_bonus_batch(walls, line_tiles, line_nums)
+        start = 0
+        for i, base in enumerate([OWN, OPP]):
+            end = start + (1 if same[i] else n)
+            out[:, base:base+PLAYER_FEATURES] = board_features[start:end]
+            start = end
+        np.sum(states[:, FACTORIES:CENTER].reshape(n, NUM_FACTORIES, NUM_TILES), axis=1,
+               out=out[:, FACTORY_COLORS:CENTER_COLORS])
+        out[:, CENTER_COLORS:CENTER_FIRST_PLAYER] = states[:, CENTER:CENTER+NUM_TILES]
+        out[:, CENTER_FIRST_PLAYER] = states[:, CENTER+NUM_TILES]
+        out[:, BAG_COLORS:LID_COLORS] = states[:, BAG:LID]
+        out[:, LID_COLORS:BIAS] = states[:, LID:NEXT_PLAYER]
+        out[:, BIAS] = 1
+        return out
+
+    def encode_models(self, models):
+        # Features of a list of Models
+        self.reserve(len(models))
+        for i, model in enumerate(models):
+            State.from_model(model, self.states[i])
+        return self.encode(self.states[:len(models)])
+
+def encode(states):
+    # Features of a (n, STATE_SIZE) array of State data in a new array
+    return Encoder(len(states)).encode(states)
+
+def encode_models(models):
+    return Encoder(len(models)).encode_models(models)
+
+def model_features(model):
+    # Features of one Model, usable as replay.Replayer.extract's features
+    return encode_models([model])[0]
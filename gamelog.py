@@ -0,0 +1,209 @@
+# Compact binary log of complete games.
+#
+# A log file starts with a short header, followed by one record per game:
+#   RECORD_HEADER: run seed (16 bytes), game index, number of body bytes and
+#                  the final score of every player
+#   body:          for every round, ROUND_MARKER and the factory draws packed
+#                  two tiles per byte, then one byte for every move
+# A move byte is ((factory+1)*NUM_TILES + tile.value-1)*(NUM_TILES+1) + pattern_line+1,
+# so all moves fit below ROUND_MARKER.
+# The writer appends the offset of every record to a sidecar index file
+# (path + '.idx', little-endian uint64), which the reader memory-maps together
+# with the log for random access.  A missing index is rebuilt by scanning.
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+from constants import *
+from model import Move, Tile
+
+MAGIC = b'AZLG'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sBBBB')
+RECORD_HEADER = struct.Struct('<16sIH' + 'h' * NUM_PLAYERS)
+SEED_BYTES = 16
+ROUND_MARKER = 0xFF
+ROUND_TILES = NUM_FACTORIES * TILES_PER_FACTORY
+FACTORY_BYTES = (ROUND_TILES + 1) // 2
+
+# MOVES[byte] is the Move encoded by byte
+MOVES = [Move(factory, tile, pattern_line)
+         for factory in range(-1, NUM_FACTORIES)
+         for tile in list(Tile)[:NUM_TILES]
+         for pattern_line in range(-1, NUM_TILES)]
+assert len(MOVES) <= ROUND_MARKER
+TILES = [None] + list(Tile) # TILES[value], 0 is an empty factory slot
+
+# rounds is a list of Rounds.  factories holds the tiles each factory was
+# filled with, moves the moves played in the round in order.
+GameRecord = namedtuple('GameRecord', ['game', 'seed', 'scores', 'rounds'])
+Round = namedtuple('Round', ['factories', 'moves'])
+
+def encode_move(move):
+    return (((move.factory + 1) * NUM_TILES + move.tile.value - 1) * (NUM_TILES + 1)
+            + move.pattern_line + 1)
+
+def encode_factories(factories):
+    # Tile values of all factory slots, two 3-bit values per byte
+    values = []
+    for factory in factories:
+        values += [tile.value for tile in factory]
+        values += [0] * (TILES_PER_FACTORY - len(factory))
+    values += [0] * (2 * FACTORY_BYTES - len(values))
+    return bytes(values[i] | values[i+1] << 3 for i in range(0, len(values), 2))
+
+def decode_factories(data):
+    values = []
+    for byte in data:
+        values += [byte & 7, byte >> 3]
+    return [[TILES[value] for value in values[TILES_PER_FACTORY*i:TILES_PER_FACTORY*(i+1)] if value]
+            for i in range(NUM_FACTORIES)]
+
+def encode_record(game, seed, scores, body):
+    # Bytes of one record.  seed is the seed of the run, an int below 2**128.
+    if len(body) >= 2**16:
+        raise ValueError("Game too long to record: {} bytes".format(len(body)))
+    return RECORD_HEADER.pack(
+        int(seed).to_bytes(SEED_BYTES, 'little'), game, len(body), *scores) + bytes(body)
+
+def decode_record(data, offset=0):
+    # Return the GameRecord at offset in data and the offset of the next record
+    header = RECORD_HEADER.unpack_from(data, offset)
+    seed, game, length = header[:3]
+    start = offset + RECORD_HEADER.size
+    body = data[start:start + length]
+    rounds = []
+    i = 0
+    while i < len(body):
+        assert body[i] == ROUND_MARKER, "Corrupt game record {}".format(game)
+        factories = decode_factories(body[i + 1:i + 1 + FACTORY_BYTES])
+        i += 1 + FACTORY_BYTES
+        end = body.find(ROUND_MARKER, i)
+        if end == -1:
+            end = len(body)
+        rounds.append(Round(factories, [MOVES[byte] for byte in body[i:end]]))
+        i = end
+    record = GameRecord(game, int.from_bytes(seed, 'little'), list(header[3:]), rounds)
+    return record, start + length
+
+class GameRecorder:
+    # Collects the factory draws and moves of one game while it is played.
+    # Call start_round after every Model.setup_round and record_move for
+    # every move, then finish with the finished Model.
+    def __init__(self, game=0, seed=0):
+        self.game = game
+        self.seed = seed
+        self.body = bytearray()
+
+    def start_round(self, model):
+        self.body.append(ROUND_MARKER)
+        self.body += encode_factories(model.factories)
+
+    def record_move(self, move):
+        self.body.append(encode_move(move))
+
+    def finish(self, model):
+        # Return the encoded record of the game
+        scores = [board.score for board in model.boards]
+        return encode_record(self.game, self.seed, scores, self.body)
+
+def file_header():
+    return FILE_HEADER.pack(MAGIC, VERSION, NUM_PLAYERS, NUM_FACTORIES, TILES_PER_FACTORY)
+
+def check_header(data, path):
+    if len(data) < FILE_HEADER.size or FILE_HEADER.unpack_from(data) != FILE_HEADER.unpack(file_header()):
+        raise ValueError("{} is not a game log of this version".format(path))
+
+class GameLogWriter:
+    # Append-only writer of a game log and its index.  Writing to an
+    # existing log appends to it.  Use as a context manager or call close().
+    def __init__(self, path):
+        self.path = path
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            with open(path, 'rb') as f:
+                check_header(f.read(FILE_HEADER.size), path)
+            if not os.path.exists(path + '.idx'):
+                write_index(path)
+        self.file = open(path, 'ab')
+        self.index = open(path + '.idx', 'ab')
+        if not exists:
+            self.file.write(file_header())
+        self.offset = self.file.tell()
+
+    def write(self, record):
+        # Append one encoded record, as returned by GameRecorder.finish
+        self.index.write(struct.pack('<Q', self.offset))
+        self.file.write(record)
+        self.offset += len(record)
+
+    def flush(self):
+        self.file.flush()
+        self.index.flush()
+
+    def close(self):
+        self.file.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def scan_offsets(data):
+    # Offsets of all records in the log data
+    offsets = []
+    offset = FILE_HEADER.size
+    while offset < len(data):
+        offsets.append(offset)
+        length = RECORD_HEADER.unpack_from(data, offset)[2]
+        offset += RECORD_HEADER.size + length
+    return offsets
+
+def write_index(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    check_header(data, path)
+    np.array(scan_offsets(data), dtype='<u8').tofile(path + '.idx')
+
+class GameLogReader:
+    # Random access to the records of a game log without loading it.
+    # Both the log and its index are memory-mapped: len(reader), reader[i]
+    # and iteration decode one record at a time.
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path + '.idx'):
+            write_index(path)
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        check_header(self.data, path)
+        if os.path.getsize(path + '.idx'):
+            self.offsets = np.memmap(path + '.idx', dtype='<u8', mode='r')
+        else:
+            self.offsets = np.zeros(0, dtype='<u8')
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        return decode_record(self.data, int(self.offsets[i]))[0]
+
+    def __iter__(self):
+        offset = FILE_HEADER.size
+        for _ in range(len(self)):
+            record, offset = decode_record(self.data, offset)
+            yield record
+
+    def close(self):
+        self.offsets = None
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,72 @@
+# Player with a learned evaluation of positions, see train.py.
+# The shipped learned_weights.npz was fitted on 1300 heuristic self-play games:
+#   python simulate.py heuristic heuristic --games 1300 --seed 17 --record selfplay.azlog
+#   python train.py selfplay.azlog
+import os
+
+import numpy as np
+
+from constants import *
+from features import Encoder, NUM_FEATURES
+from rollout import Batch
+from state import State
+
+DEFAULT_WEIGHTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'learned_weights.npz')
+
+class ValueModel:
+    # A small fully connected network on the features of features.py,
+    # evaluated with NumPy.  layers are the weight matrices, hidden layers
+    # use relu.  A single (NUM_FEATURES, 1) layer is a linear model.
+    # The output is the expected final score difference for the player to move.
+    def __init__(self, layers):
+        if layers[0].shape[0] != NUM_FEATURES:
+            raise ValueError("Weights are for {} features, not {}".format(
+                layers[0].shape[0], NUM_FEATURES))
+        self.layers = [np.asarray(layer, dtype=np.float32) for layer in layers]
+
+    @classmethod
+    def load(cls, path):
+        # Layers are stored as w0, w1, ... in an .npz file
+        with np.load(path) as data:
+            return cls([data['w{}'.format(i)] for i in range(len(data.files))])
+
+    def save(self, path):
+        np.savez(path, **{'w{}'.format(i): layer for i, layer in enumerate(self.layers)})
+
+    def __call__(self, features):
+        # Values of a (n, NUM_FEATURES) batch of features
+        x = features
+        for layer in self.layers[:-1]:
+            x = np.maximum(x @ layer, 0)
+        return (x @ self.layers[-1]).reshape(-1)
+
+class Learned_Player:
+    # Plays the move whose resulting position the ValueModel likes least for
+    # the opponent.  The positions after all candidate moves are built
+    # together by rollout.Batch, encoded together and valued with one matrix
+    # product per layer.  weights is the path of an .npz file saved by
+    # ValueModel.save, see train.py.
+    def __init__(self, weights=DEFAULT_WEIGHTS, rng=None):
+        # The choice of move is deterministic, rng is only handed to Batch
+        self.rng = rng if rng is not None else np.random.default_rng()
+        if not os.path.exists(weights):
+            raise FileNotFoundError(
+                "No weights at {}, fit them from a game log with train.py".format(weights))
+        self.value_model = ValueModel.load(weights)
+        self.encoder = Encoder(64)
+
+    def move_values(self, gamestate, moves):
+        # Value of each of moves for the player to move
+        state = State.from_model(gamestate, self.encoder.states[0])
+        batch = Batch(np.repeat(state.data[None], len(moves), axis=0), self.rng)
+        batch.apply_moves(
+            np.arange(len(moves)),
+            np.array([NUM_FACTORIES if move.from_center() else move.factory for move in moves]),
+            np.array([move.tile.value - 1 for move in moves]),
+            np.array([NUM_TILES if move.to_floor_line() else move.pattern_line for move in moves]))
+        features = self.encoder.encode(batch.to_states())
+        return -self.value_model(features)
+
+    def move(self, gamestate):
+        moves = gamestate.legal_moves(unique=True)
+        return moves[int(np.argmax(self.move_values(gamestate, moves)))]
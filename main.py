@@ -1,8 +1,17 @@
+import argparse
 import tkinter as tk
 
 from controller import Controller
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Play Azul")
+    parser.add_argument('--record', metavar='PATH', default=None,
+                        help="append every finished game to this game log")
+    parser.add_argument('--think-time', type=float, default=1.0,
+                        help="seconds the computer may think per move, for players with a time limit")
+    parser.add_argument('--processes', action='store_true',
+                        help="let the computer think in a separate process instead of a thread")
+    args = parser.parse_args()
     root = tk.Tk()
-    app = Controller(root)
-    root.mainloop()
\ No newline at end of file
+    app = Controller(root, args.record, args.think_time, args.processes)
+    root.mainloop()
@@ -0,0 +1,177 @@
+# Monte Carlo Tree Search player.
+import math
+import time
+
+import numpy as np
+
+from constants import *
+from basic_players import Heuristic_Player
+import rollout
+from state import State
+
+class Node:
+    # A node of the search tree for one position in the current round.
+    # player is the player who made move to reach this node, wins is the
+    # total reward of playouts through this node from that player's view.
+    # untried is None until the moves of the position are generated.
+    __slots__ = ('move', 'player', 'children', 'untried', 'visits', 'wins')
+
+    def __init__(self, move, player):
+        self.move = move
+        self.player = player
+        self.children = []
+        self.untried = None
+        self.visits = 0
+        self.wins = 0.0
+
+    def uct_child(self, exploration):
+        log_visits = math.log(self.visits)
+        return max(
+            self.children,
+            key=lambda child: child.wins / child.visits
+                + exploration * math.sqrt(log_visits / child.visits))
+
+    def most_visited_child(self):
+        return max(self.children, key=lambda child: child.visits)
+
+def game_rewards(model):
+    # Return the reward of each player for a finished game:
+    # 1 for the winner, 0 for the loser and 0.5 each for a tie
+    scores = [board.score for board in model.boards]
+    best = max(scores)
+    winners = [i for i, score in enumerate(scores) if score == best]
+    return [1.0 / len(winners) if i in winners else 0.0 for i in range(NUM_PLAYERS)]
+
+class MCTS_Player:
+    # UCT search over the moves of the current round.  Tree nodes stop at
+    # the end of the round, playouts continue through cleanup_round and
+    # setup_round to the end of the game.
+    # Each move searches until time_limit seconds have passed or iterations
+    # tree iterations are done, whichever comes first (either may be None).
+    # rollout is 'random' or 'heuristic' (Heuristic_Player moves), and every
+    # new leaf gets leaf_rollouts playouts.  rollout 'batch' plays random
+    # playouts for all leaf_rollouts games at once with rollout.Batch.
+    # The subtree of the position reached after the opponent's reply is kept
+    # for the next move.
+    # rng is the numpy.random.Generator for the search, including the factory
+    # fills of playouts.
+    def __init__(
+            self, time_limit=1.0, iterations=None, rollout='random',
+            exploration=0.7, leaf_rollouts=1, rng=None):
+        assert time_limit or iterations, "MCTS_Player needs a time limit or an iteration cap"
+        assert rollout in ['random', 'heuristic', 'batch'], "Unknown rollout {}".format(rollout)
+        self.time_limit = time_limit
+        self.iterations = iterations
+        self.rollout = rollout
+        self.exploration = exploration
+        self.leaf_rollouts = leaf_rollouts
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.heuristic = Heuristic_Player()
+        self.root = None
+        self.root_model = None
+        self.last_stats = {}
+
+    def rollout_move(self, model):
+        if self.rollout == 'heuristic':
+            return self.heuristic.move(model)
+        moves = model.legal_moves()
+        return moves[self.rng.integers(len(moves))]
+
+    def playout(self, model):
+        # Play model to the end of the game and return the rewards
+        while True:
+            while not model.round_over():
+                model.make_move(self.rollout_move(model))
+            model.cleanup_round()
+            if model.game_over():
+                model.score_endgame()
+                return game_rewards(model)
+            model.setup_round()
+
+    def playouts(self, model):
+        # Run the playouts for a new leaf at model, which is left unchanged.
+        # Return the number of playouts and the total reward of each player.
+        if self.rollout == 'batch':
+            rewards = rollout.win_rates(model, self.leaf_rollouts, self.rng)
+            return self.leaf_rollouts, (rewards * self.leaf_rollouts).tolist()
+        totals = [0.0] * NUM_PLAYERS
+        for _ in range(self.leaf_rollouts):
+            for i, reward in enumerate(self.playout(model.copy())):
+                totals[i] += reward
+        return self.leaf_rollouts, totals
+
+    def iterate(self, root, model):
+        # One select, expand, playout and backpropagate step.
+        # model is at the root position and is restored before returning.
+        # Return the number of playouts.
+        node = root
+        path = [node]
+        undos = []
+        while node.untried is not None and not node.untried and node.children:
+            node = node.uct_child(self.exploration)
+            undos.append(model.make_move(node.move))
+            path.append(node)
+        if node.untried is None:
+            node.untried = [] if model.round_over() else model.legal_moves(unique=True)
+        if node.untried:
+            move = node.untried.pop(self.rng.integers(len(node.untried)))
+            child = Node(move, model.next_player)
+            node.children.append(child)
+            undos.append(model.make_move(move))
+            path.append(child)
+        num_playouts, rewards = self.playouts(model)
+        for node in path:
+            node.visits += num_playouts
+            node.wins += rewards[node.player]
+        for undo in reversed(undos):
+            model.unmake_move(undo)
+        return num_playouts
+
+    def reusable_root(self, gamestate):
+        # Return the node of the previous search tree for gamestate, if any
+        if self.root is None:
+            return None
+        state = State.from_model(gamestate)
+        model = self.root_model
+        for child in self.root.children:
+            undo = model.make_move(child.move)
+            found = State.from_model(model) == state
+            model.unmake_move(undo)
+            if found:
+                return child
+        return None
+
+    def search(self, gamestate):
+        # Grow the tree for gamestate within the budget and return its root
+        root = self.reusable_root(gamestate)
+        reused = root.visits if root else 0
+        if root is None:
+            root = Node(None, (gamestate.next_player - 1) % NUM_PLAYERS)
+        model = gamestate.copy()
+        model.rng = self.rng
+        start = time.perf_counter()
+        deadline = start + self.time_limit if self.time_limit else math.inf
+        iterations = playouts = 0
+        while (self.iterations is None or iterations < self.iterations) and time.perf_counter() < deadline:
+            playouts += self.iterate(root, model)
+            iterations += 1
+        seconds = time.perf_counter() - start
+        self.last_stats = {
+            'iterations': iterations,
+            'playouts': playouts,
+            'seconds': seconds,
+            'playouts_per_second': playouts / seconds if seconds else 0.0,
+            'reused_visits': reused,
+        }
+        return root, model
+
+    def move(self, gamestate):
+        root, model = self.search(gamestate)
+        if not root.children:
+            return self.rollout_move(gamestate)
+        best = root.most_visited_child()
+        # Keep the subtree after our move to find the opponent's reply in it
+        model.make_move(best.move)
+        self.root = best
+        self.root_model = model
+        return best.move
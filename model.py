@@ -1,8 +1,10 @@
 # Azul game model. 
 import numpy as np
+from collections import namedtuple
 from enum import Enum
 
 from constants import *
+import zobrist
 
 class Tile(Enum):
     # Tile.blue.name = "blue"
@@ -14,6 +16,61 @@ class Tile(Enum):
     teal = 5
     white = 6 # first player tile
 
+COLORED_TILES = [tile for tile in Tile if tile != Tile.white]
+COLOR_INDICES = np.arange(NUM_TILES) # tile.value - 1 of COLORED_TILES
+
+# Besides the wall array, a PlayerBoard keeps its wall as two bit masks:
+# wall_mask has bit row*NUM_TILES + col set for every filled cell, and the
+# transposed wall_mask_t has bit col*NUM_TILES + row set.  NUM_TILES bits of
+# either mask give a row or a column, which index the tables below, so wall
+# placement scores and endgame bonuses are a few table lookups.
+# (A table over whole 25 bit masks would need tens of millions of entries.)
+LINE_MASK = (1 << NUM_TILES) - 1
+FIRST_CELLS = sum(1 << (i*NUM_TILES) for i in range(NUM_TILES))
+
+def run_length(mask, pos):
+    # Number of consecutive set bits of a NUM_TILES bit mask through bit pos,
+    # counting bit pos as set
+    num = 1
+    for i in range(pos+1, NUM_TILES):
+        if not mask >> i & 1:
+            break
+        num += 1
+    for i in range(pos-1, -1, -1):
+        if not mask >> i & 1:
+            break
+        num += 1
+    return num
+
+# RUN_LENGTH[mask][pos] = run_length(mask, pos)
+RUN_LENGTH = [[run_length(mask, pos) for pos in range(NUM_TILES)] for mask in range(1 << NUM_TILES)]
+
+# PLACEMENT_SCORE[row_connected][col_connected] is the score for placing a tile
+# connected to that many tiles (itself included) in its row and column
+PLACEMENT_SCORE = [
+    [col if row == 1 else row if col == 1 else row + col for col in range(NUM_TILES+1)]
+    for row in range(NUM_TILES+1)]
+
+# COLOR_MASKS[tile.value] is the wall_mask of all cells for that tile
+COLOR_MASKS = [0] + [
+    sum(1 << (row*NUM_TILES + (value + row - 1) % NUM_TILES) for row in range(NUM_TILES))
+    for value in range(1, NUM_TILES+1)]
+
+def wall_masks(wall):
+    # Return (wall_mask, wall_mask_t) for a wall array
+    mask = mask_t = 0
+    for row, col in zip(*np.nonzero(wall)):
+        mask |= 1 << (row*NUM_TILES + col)
+        mask_t |= 1 << (col*NUM_TILES + row)
+    return mask, mask_t
+
+def complete_lines(mask):
+    # Number of complete rows of a wall_mask, or columns of a wall_mask_t
+    full = mask
+    for i in range(1, NUM_TILES):
+        full &= mask >> i
+    return bin(full & FIRST_CELLS).count('1')
+
 class PatternLine:
     # A line on a player's board which contains tiles of one type. 
     # The max number of tiles is capacity, and the current number is num
@@ -60,11 +117,14 @@ class PlayerBoard:
     # Wall is the NUM_TILES-by-NUM_TILES grid of placed tiles
     # Pattern lines are NUM_TILES many rows of tiles that have not been placed on the wall
     # Floor line is a line of unused tiles
-    def __init__(self, wall, score, pattern_lines, floor_line):
+    # wall_mask and wall_mask_t are bit masks of the wall, see above.  They
+    # are computed from wall unless given.
+    def __init__(self, wall, score, pattern_lines, floor_line, masks=None):
         self.wall = wall
         self.score = score
         self.pattern_lines = pattern_lines
         self.floor_line = floor_line
+        self.wall_mask, self.wall_mask_t = masks if masks else wall_masks(wall)
 
     @classmethod
     def empty(cls):
@@ -77,7 +137,7 @@ class PlayerBoard:
     def add_to_floor_line(self, tile, num_tiles):
         # add tiles to floor line
         # Return the extra tile which don't fit on floor line
-        num_to_place = min(num_tiles, FLOOR_CAPACITY - len(self.floor_line))
+        num_to_place = max(min(num_tiles, FLOOR_CAPACITY - len(self.floor_line)), 0)
         num_to_return = num_tiles - num_to_place
         self.floor_line += ([tile] * num_to_place)
         return [tile] * num_to_return
@@ -88,53 +148,44 @@ class PlayerBoard:
         # There is a possible error here.  
         # should pass this through the add_to_floor_line method and send leftovers to discard pile
 
+    def open_lines(self):
+        # Return a dict mapping each colored tile to the pattern line indices
+        # where it can be placed, starting with -1 for the floor line.
+        # Each wall row and pattern line is looked at once.
+        lines = {tile: [-1] for tile in COLORED_TILES}
+        for row, line in enumerate(self.pattern_lines):
+            if line.is_full():
+                continue
+            on_wall = self.wall[row].tolist()
+            if line.tile:
+                if line.tile.value not in on_wall:
+                    lines[line.tile].append(row)
+            else:
+                for tile in COLORED_TILES:
+                    if tile.value not in on_wall:
+                        lines[tile].append(row)
+        return lines
+
     def has_complete_row(self):
-        return True in (self.wall != 0).all(axis=1)
+        return complete_lines(self.wall_mask) > 0
 
     def tiles_in_a_row(self, row, col):
-        num = 1
-        for i in range(col+1, NUM_TILES):
-            if self.wall[row, i]:
-                num += 1
-            else:
-                break
-        for i in range(col-1, -1, -1):
-            if self.wall[row, i]:
-                num += 1
-            else:
-                break
-        return num
+        return RUN_LENGTH[self.wall_mask >> (row*NUM_TILES) & LINE_MASK][col]
 
     def tiles_in_a_col(self, row, col):
-        num = 1
-        for i in range(row+1, NUM_TILES):
-            if self.wall[i, col]:
-                num += 1
-            else:
-                break
-        for i in range(row-1, -1, -1):
-            if self.wall[i, col]:
-                num += 1
-            else:
-                break
-        return num
+        return RUN_LENGTH[self.wall_mask_t >> (col*NUM_TILES) & LINE_MASK][row]
 
     def tile_placement_score(self, row, col):
         # return the score of placing a tile in the (row, col) position of the wall
-        row_connected = self.tiles_in_a_row(row, col)
-        col_connected = self.tiles_in_a_col(row, col)
-        if row_connected == 1:
-            return col_connected
-        elif col_connected == 1:
-            return row_connected
-        else:
-            return row_connected + col_connected
+        return PLACEMENT_SCORE[self.tiles_in_a_row(row, col)][self.tiles_in_a_col(row, col)]
 
     def add_to_wall(self, row, tile):
         # Add the tile to the row of the wall
         # Return the score of placing the tile in this position
         column = (tile.value + row - 1) % 5
         self.wall[row,column] = tile.value
+        self.wall_mask |= 1 << (row*NUM_TILES + column)
+        self.wall_mask_t |= 1 << (column*NUM_TILES + row)
         return self.tile_placement_score(row, column)
 
     def floor_penalty(self):
@@ -159,17 +210,13 @@ class PlayerBoard:
         return discard_tiles
 
     def complete_all_tiles(self):
-        count = 0
-        for tile in list(Tile):
-            if np.sum(self.wall == tile.value) == NUM_TILES:
-                count += 1
-        return count
+        return sum(self.wall_mask & mask == mask for mask in COLOR_MASKS[1:])
 
     def complete_columns(self):
-        return np.sum((self.wall != 0).all(axis=0))
+        return complete_lines(self.wall_mask_t)
 
     def complete_rows(self):
-        return np.sum((self.wall != 0).all(axis=1))
+        return complete_lines(self.wall_mask)
 
     def score_endgame(self):
         all_tiles = self.complete_all_tiles()
@@ -182,16 +229,21 @@ class PlayerBoard:
             np.copy(self.wall), 
             self.score, 
             [line.copy() for line in self.pattern_lines], 
-            self.floor_line.copy())
+            self.floor_line.copy(),
+            (self.wall_mask, self.wall_mask_t))
 
 class Model:
     # boards is a list of one PlayerBoard for every player
     # factories is a list of NUM_FACTORIES lists.  
     # Each internal list contains at most TILES_PER_FACTORY tiles
     # center is a list of tiles
-    # draw_pile is a list of tiles
-    # discard_pile is a list of tiles
+    # draw_pile (the bag) and discard_pile (the lid) are arrays of the number
+    # of tiles of each color, indexed by tile.value - 1
     # next_player is an int in range(NUM_PLAYERS)
+    # rng is the numpy.random.Generator used to fill the factories
+    # zobrist_key and factory_key are the parts of the Zobrist hash of the
+    # position, None until zobrist_hash() is first called.  From then on
+    # make_move and unmake_move keep them updated, see zobrist.py.
     def __init__(
             self,
             boards,
@@ -199,23 +251,65 @@ class Model:
             center,
             draw_pile,
             discard_pile,
-            next_player):
+            next_player,
+            rng=None):
         self.boards = boards
         self.factories = factories
         self.center = center
         self.draw_pile = draw_pile
         self.discard_pile = discard_pile
         self.next_player = next_player
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.zobrist_key = None
+        self.factory_key = None
 
     @classmethod
-    def start(cls):
+    def start(cls, rng=None):
         return cls(
             [PlayerBoard.empty() for _ in range(NUM_PLAYERS)],
             [[]] * NUM_FACTORIES,
             [Tile.white],
-            [Tile.blue, Tile.yellow, Tile.red, Tile.black, Tile.teal] * TILES_PER_COLOR,
-            [],
-            0)
+            np.full(NUM_TILES, TILES_PER_COLOR),
+            np.zeros(NUM_TILES, dtype=int),
+            0,
+            rng)
+
+    def copy(self):
+        model = Model(
+            [board.copy() for board in self.boards],
+            [factory.copy() for factory in self.factories],
+            self.center.copy(),
+            self.draw_pile.copy(),
+            self.discard_pile.copy(),
+            self.next_player,
+            self.rng)
+        model.zobrist_key = self.zobrist_key
+        model.factory_key = self.factory_key
+        return model
+
+    def zobrist_hash(self):
+        # Return the 64-bit Zobrist hash of the position, see zobrist.py
+        if self.zobrist_key is None:
+            self.zobrist_key = zobrist.model_key(self)
+            self.factory_key = zobrist.factory_key(self.factories)
+        return self.zobrist_key ^ self.factory_key
+
+    def canonical_factories(self):
+        # Return the factories as sorted tuples of tile values, in sorted
+        # order, and for each the index of the factory it is in the model.
+        # Positions which differ only in the order of their factories have
+        # the same canonical factories.
+        keyed = sorted(
+            (tuple(sorted(tile.value for tile in factory)), factory_idx)
+            for factory_idx, factory in enumerate(self.factories))
+        return [content for content, _ in keyed], [factory_idx for _, factory_idx in keyed]
+
+    def distinct_factories(self):
+        # Indices of the first factory holding each distinct set of tiles, in order
+        canonical, indices = self.canonical_factories()
+        return sorted(
+            indices[i] for i in range(len(canonical))
+            if i == 0 or canonical[i] != canonical[i - 1])
 
     def is_valid_move(self, move, player):
         # returns True if a move is valid for player in the current game state
@@ -233,9 +327,64 @@ class Model:
         pattern_line = player_board.pattern_lines[move.pattern_line]
         return pattern_line.open_for_tile(move.tile)
 
+    def tile_sources(self, unique=False):
+        # Return a list of (factory index, tile, count) for every colored tile
+        # in every factory, followed by the center (factory index -1).
+        # If unique is True, factories holding the same tiles as an earlier
+        # factory are left out: taking from either leads to positions which
+        # only differ in the order of the factories.
+        sources = []
+        factory_indices = self.distinct_factories() if unique else range(NUM_FACTORIES)
+        for factory_idx in factory_indices:
+            factory = self.factories[factory_idx]
+            for tile in COLORED_TILES:
+                count = factory.count(tile)
+                if count:
+                    sources.append((factory_idx, tile, count))
+        for tile in COLORED_TILES:
+            count = self.center.count(tile)
+            if count:
+                sources.append((-1, tile, count))
+        return sources
+
+    def legal_moves(self, unique=False, sources=None):
+        # Return every valid Move for next_player.
+        # Open pattern lines per tile and tile counts per factory are computed
+        # once, so this is much cheaper than calling is_valid_move per candidate.
+        # unique leaves out the moves from duplicate factories, see tile_sources.
+        # sources is tile_sources(unique) if the caller has it already.
+        open_lines = self.boards[self.next_player].open_lines()
+        if sources is None:
+            sources = self.tile_sources(unique)
+        return [
+            Move(factory_idx, tile, line_idx)
+            for factory_idx, tile, _ in sources
+            for line_idx in open_lines[tile]]
+
     def make_move(self, move):
         # play out the given move on the PlayerBoard corresponding to the index of player
-        player_board = self.boards[self.next_player]
+        # Return an undo record which unmake_move uses to restore the current state.
+        # The lists replaced by the move are kept in the record, lists grown
+        # by the move only need their previous length.
+        player = self.next_player
+        player_board = self.boards[player]
+        if move.to_floor_line():
+            undo_line = None
+        else:
+            line = player_board.pattern_lines[move.pattern_line]
+            undo_line = (line.tile, line.num)
+        if move.from_center():
+            undo_source = self.center
+        else:
+            undo_source = self.factories[move.factory]
+        undo = (player, move, undo_source, len(self.center), undo_line,
+                len(player_board.floor_line), int(self.discard_pile[move.tile.value - 1]),
+                (self.zobrist_key, self.factory_key))
+        if self.zobrist_key is not None:
+            self.zobrist_key ^= zobrist.move_key(self, move)
+            if not move.from_center():
+                self.factory_key = (self.factory_key - zobrist.pile_key(
+                    zobrist.FACTORY_KEYS, self.factories[move.factory])) % 2**64
         if move.from_center():
             assert (move.tile in self.center), "No {} tiles in the center".format(move.tile.name)
             if Tile.white in self.center:
@@ -250,30 +399,76 @@ class Model:
             self.factories[move.factory] = []
         if move.to_floor_line():
             tiles_to_discard = player_board.add_to_floor_line(move.tile, num_tiles)
-            self.discard_pile += tiles_to_discard
+            self.discard_pile[move.tile.value - 1] += len(tiles_to_discard)
         else:
             player_board.add_to_pattern_line(move.pattern_line, move.tile, num_tiles)
+        if self.zobrist_key is not None:
+            self.zobrist_key ^= zobrist.move_key(self, move)
         self.next_player = (self.next_player + 1) % NUM_PLAYERS
+        if self.zobrist_key is not None:
+            self.zobrist_key ^= zobrist.SIDE_KEYS[player] ^ zobrist.SIDE_KEYS[self.next_player]
+        return undo
+
+    def unmake_move(self, undo):
+        # Take back the move which returned undo from make_move.
+        # Moves must be taken back in the reverse order they were made.
+        player, move, undo_source, center_len, undo_line, floor_len, discarded, key = undo
+        player_board = self.boards[player]
+        del player_board.floor_line[floor_len:]
+        self.discard_pile[move.tile.value - 1] = discarded
+        if undo_line:
+            line = player_board.pattern_lines[move.pattern_line]
+            line.tile, line.num = undo_line
+        if move.from_center():
+            self.center = undo_source
+        else:
+            del self.center[center_len:]
+            self.factories[move.factory] = undo_source
+        self.next_player = player
+        self.zobrist_key, self.factory_key = key
 
-    def setup_round(self):
+    def setup_round(self, factories=None):
         # setup for a new round
-        if len(self.draw_pile) < NUM_FACTORIES * TILES_PER_FACTORY:
-            self.replenish_draw_pile()
-        self.fill_factories()
+        # factories optionally gives the tiles drawn into every factory,
+        # e.g. when replaying a game log, instead of drawing them at random
+        self.zobrist_key = None
+        self.fill_factories(factories)
         self.center = [Tile.white]
 
-    def fill_factories(self):
-        # Fill the factories with tiles from the draw pile
-        assert (len(self.draw_pile) >= NUM_FACTORIES * TILES_PER_FACTORY), "Not enough tiles in draw pile to fill factories"
-        indices = np.random.permutation(len(self.draw_pile))
-        for i in range(NUM_FACTORIES):
-            factory_indices = indices[TILES_PER_FACTORY*i:TILES_PER_FACTORY*(i+1)]
-            self.factories[i] = [self.draw_pile[idx] for idx in factory_indices]
-        self.draw_pile = [self.draw_pile[idx] for idx in indices[TILES_PER_FACTORY*NUM_FACTORIES:]]
+    def fill_factories(self, factories=None):
+        # Fill the factories one after the other with tiles from the draw pile.
+        # When the draw pile runs out, the discard pile is put into it and
+        # filling goes on.  If both run out, the remaining factories stay
+        # short or empty.  The colors drawn before and after the draw pile
+        # runs out are each one multivariate hypergeometric draw from its
+        # counts, shuffled into the factories, so the cost does not depend on
+        # the number of tiles in the draw pile.
+        if factories is not None:
+            counts = np.zeros(NUM_TILES, dtype=int)
+            for factory in factories:
+                for tile in factory:
+                    counts[tile.value - 1] += 1
+            if counts.sum() > self.draw_pile.sum():
+                # the draw pile ran out while these factories were filled
+                self.replenish_draw_pile()
+            self.draw_pile -= counts
+            self.factories = [list(factory) for factory in factories]
+            return
+        drawn = []
+        while len(drawn) < NUM_FACTORIES * TILES_PER_FACTORY:
+            if not self.draw_pile.any():
+                if not self.discard_pile.any():
+                    break
+                self.replenish_draw_pile()
+            counts = self.rng.multivariate_hypergeometric(self.draw_pile, min(
+                NUM_FACTORIES * TILES_PER_FACTORY - len(drawn), int(self.draw_pile.sum())))
+            self.draw_pile -= counts
+            drawn += [COLORED_TILES[i] for i in self.rng.permutation(np.repeat(COLOR_INDICES, counts))]
+        self.factories = [drawn[TILES_PER_FACTORY*i:TILES_PER_FACTORY*(i+1)] for i in range(NUM_FACTORIES)]
 
     def replenish_draw_pile(self):
         self.draw_pile += self.discard_pile
-        self.discard_pile = []
+        self.discard_pile[:] = 0
 
     def game_over(self):
         for board in self.boards:
@@ -293,9 +488,11 @@ class Model:
         # Set the next_player based on who has the white tile.
         # Update the score of each playerboard.
         # Clear completed pattern lines, and update each player's wall
+        self.zobrist_key = None
         self.next_player = self.player_with_white_tile()
         for player_board in self.boards:
-            self.discard_pile += player_board.score_round()
+            for tile in player_board.score_round():
+                self.discard_pile[tile.value - 1] += 1
 
     def player_with_white_tile(self):
         for i in range(NUM_PLAYERS):
@@ -303,6 +500,7 @@ class Model:
                 return i
 
     def score_endgame(self):
+        self.zobrist_key = None
         for player_board in self.boards:
             player_board.score_endgame()
 
@@ -316,15 +514,12 @@ class Model:
             factory_indices.append(-1)
         return sorted(factory_indices)
 
-class Move:
+class Move(namedtuple('Move', ['factory', 'tile', 'pattern_line'])):
     # A move consists of a 
     # 1) A factory index (-1 for center)
     # 2) A tile type
     # 3) A pattern line index (-1 for floor line)
-    def __init__(self, factory, tile, pattern_line):
-        self.factory = factory
-        self.tile = tile
-        self.pattern_line = pattern_line
+    __slots__ = ()
 
     def from_center(self):
         return self.factory == -1
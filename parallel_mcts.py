@@ -0,0 +1,106 @@
+# MCTS on a pool of worker processes.
+import os
+import time
+from collections import defaultdict
+from multiprocessing import Pool
+
+import numpy as np
+
+from constants import *
+from mcts import MCTS_Player
+
+# MCTS_Player settings handed to the workers
+SETTINGS = ['time_limit', 'iterations', 'rollout', 'exploration', 'leaf_rollouts']
+
+def _root_search(args):
+    # Grow an independent tree in a worker and return its root statistics
+    gamestate, seed, settings = args
+    player = MCTS_Player(**dict(settings, rng=np.random.default_rng(seed)))
+    root, _ = player.search(gamestate)
+    children = [(child.move, child.visits, child.wins) for child in root.children]
+    return children, player.last_stats
+
+def _leaf_playouts(args):
+    # Run playouts for one leaf in a worker
+    model, seed, settings = args
+    player = MCTS_Player(**dict(settings, rng=np.random.default_rng(seed)))
+    model.rng = player.rng
+    return player.playouts(model)
+
+class Parallel_MCTS_Player(MCTS_Player):
+    # MCTS_Player spread over workers processes.
+    # mode 'root': every worker grows its own tree from the position for the
+    # whole budget and the visit counts of the root moves are summed.
+    # mode 'leaf': one tree in this process, every new leaf gets its playouts
+    # from all workers at once.
+    # The pool is started on the first move, call close() to stop it.
+    # The pool can not be started in a daemonic worker process, see
+    # players.needs_main_process.
+    own_pool = True
+
+    def __init__(self, workers=None, mode='root', **settings):
+        super().__init__(**settings)
+        assert mode in ['root', 'leaf'], "Unknown parallel mode {}".format(mode)
+        self.workers = workers or os.cpu_count()
+        self.mode = mode
+        self.pool = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['pool'] = None
+        return state
+
+    def get_pool(self):
+        if self.pool is None:
+            self.pool = Pool(self.workers)
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def settings(self):
+        # The current settings of this player, which may have been changed
+        # since it was made, e.g. a time_limit set by the GUI
+        return {name: getattr(self, name) for name in SETTINGS}
+
+    def seeds(self):
+        # Independent child seeds for the workers, drawn from this player's rng
+        return np.random.SeedSequence(self.rng.integers(2**63)).spawn(self.workers)
+
+    def playouts(self, model):
+        if self.mode == 'root':
+            return super().playouts(model)
+        settings = self.settings()
+        results = self.get_pool().map(
+            _leaf_playouts, [(model, seed, settings) for seed in self.seeds()])
+        totals = [sum(rewards[i] for _, rewards in results) for i in range(NUM_PLAYERS)]
+        return sum(num for num, _ in results), totals
+
+    def root_parallel_move(self, gamestate):
+        start = time.perf_counter()
+        results = self.get_pool().map(
+            _root_search, [(gamestate, seed, self.settings()) for seed in self.seeds()])
+        visits = defaultdict(int)
+        for children, _ in results:
+            for move, child_visits, _ in children:
+                visits[move] += child_visits
+        seconds = time.perf_counter() - start
+        playouts = sum(stats['playouts'] for _, stats in results)
+        self.last_stats = {
+            'iterations': sum(stats['iterations'] for _, stats in results),
+            'playouts': playouts,
+            'seconds': seconds,
+            'playouts_per_second': playouts / seconds if seconds else 0.0,
+            'reused_visits': 0,
+        }
+        if not visits:
+            return self.rollout_move(gamestate)
+        return max(visits, key=visits.get)
+
+    def move(self, gamestate):
+        if self.mode == 'root':
+            return self.root_parallel_move(gamestate)
+        return super().move(gamestate)
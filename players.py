@@ -0,0 +1,40 @@
+# Computer players by name, for the command line tools.
+from alphabeta import AlphaBeta_Player
+from basic_players import Random_Player, Heuristic_Player
+from learned import Learned_Player
+from mcts import MCTS_Player
+from parallel_mcts import Parallel_MCTS_Player
+
+PLAYERS = {
+    'random': Random_Player,
+    'heuristic': Heuristic_Player,
+    'mcts': MCTS_Player,
+    'parallel_mcts': Parallel_MCTS_Player,
+    'alphabeta': AlphaBeta_Player,
+    'learned': Learned_Player,
+}
+
+def computer_move(player, model):
+    # Run in a worker thread or process by the GUI and the server.  The
+    # player is returned as well, so a player moving in another process
+    # keeps its state (random generator, search tree).
+    return player.move(model), player
+
+def needs_main_process(cls):
+    # Players which start their own process pool can not move in the worker
+    # processes of simulate.py and tournament.py
+    return getattr(cls, 'own_pool', False)
+
+def close_player(player):
+    # Release what a player holds on to between moves, like a process pool
+    if hasattr(player, 'close'):
+        player.close()
+
+def player_class(name):
+    # Return the player class registered as name, or with class name name
+    if name in PLAYERS:
+        return PLAYERS[name]
+    for cls in PLAYERS.values():
+        if cls.__name__ == name:
+            return cls
+    raise ValueError("Unknown player {!r}, choose from {}".format(name, ", ".join(PLAYERS)))
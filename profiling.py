@@ -0,0 +1,156 @@
+# Opt-in instrumentation of the hot paths of the model and the players.
+# enable() replaces the functions listed in hot_paths() with wrappers that
+# count calls and time them, disable() puts the originals back, so nothing
+# is measured and nothing costs anything while profiling is off.
+#
+#   with profiling.enabled() as stats:
+#       play_game(players)
+#   print(stats.format())
+#   stats.write_json('profile.json')
+#   stats.write_collapsed('profile.folded') # for flamegraph.pl or speedscope
+import functools
+import json
+import threading
+import time
+
+import evaluation
+import model
+
+def hot_paths():
+    # (owner, attribute name, phase name) of every instrumented function
+    from players import PLAYERS
+    paths = [(model.Model, name, 'Model.' + name) for name in [
+        'legal_moves', 'tile_sources', 'is_valid_move', 'make_move', 'unmake_move',
+        'setup_round', 'fill_factories', 'cleanup_round', 'score_endgame', 'copy',
+        'zobrist_hash']]
+    paths += [(model.PlayerBoard, name, 'PlayerBoard.' + name) for name in [
+        'copy', 'score_round', 'score_endgame', 'add_to_wall', 'open_lines']]
+    paths += [(evaluation, name, 'evaluation.' + name) for name in [
+        'board_arrays', 'candidate_boards', 'score_round_batch', 'predicted_bonus_batch',
+        'move_scores']]
+    for cls in PLAYERS.values():
+        for name in ['move', 'search', 'playouts', 'negamax', 'move_values']:
+            if name in vars(cls):
+                paths.append((cls, name, '{}.{}'.format(cls.__name__, name)))
+    return paths
+
+class Stats:
+    # Calls and time of every phase.  calls[phase] and seconds[phase] count
+    # every call, including calls nested in a call of the same phase.
+    # folded[stack] is the time spent in the last phase of the stack of
+    # phases itself, not in instrumented phases it called.
+    def __init__(self):
+        self.calls = {}
+        self.seconds = {}
+        self.folded = {}
+        self.local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.local = threading.local()
+
+    def stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def enter(self, phase):
+        # Frames are [phase, start time, time spent in instrumented callees]
+        self.stack().append([phase, time.perf_counter(), 0.0])
+
+    def exit(self):
+        stack = self.stack()
+        phase, start, inner = stack[-1]
+        elapsed = time.perf_counter() - start
+        path = tuple(frame[0] for frame in stack)
+        stack.pop()
+        if stack:
+            stack[-1][2] += elapsed
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + elapsed
+        self.folded[path] = self.folded.get(path, 0.0) + elapsed - inner
+
+    def merge(self, other):
+        # Add the counts of other, e.g. from a worker process
+        for phase, calls in other.calls.items():
+            self.calls[phase] = self.calls.get(phase, 0) + calls
+            self.seconds[phase] = self.seconds.get(phase, 0.0) + other.seconds[phase]
+        for path, seconds in other.folded.items():
+            self.folded[path] = self.folded.get(path, 0.0) + seconds
+        return self
+
+    def as_dict(self):
+        self_seconds = {}
+        for path, seconds in self.folded.items():
+            self_seconds[path[-1]] = self_seconds.get(path[-1], 0.0) + seconds
+        return {phase: {
+                    'calls': self.calls[phase],
+                    'seconds': self.seconds[phase],
+                    'self_seconds': self_seconds.get(phase, 0.0),
+                    'us_per_call': 1e6 * self.seconds[phase] / self.calls[phase],
+                } for phase in sorted(self.calls, key=self.seconds.get, reverse=True)}
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+    def write_collapsed(self, path):
+        # One "phase;phase;phase microseconds" line per stack
+        with open(path, 'w') as f:
+            for stack, seconds in sorted(self.folded.items()):
+                f.write("{} {}\n".format(";".join(stack), int(round(1e6 * seconds))))
+
+    def format(self, limit=20):
+        lines = ["{:<32} {:>10} {:>10} {:>10} {:>10}".format(
+            "phase", "calls", "total s", "self s", "us/call")]
+        for phase, row in list(self.as_dict().items())[:limit]:
+            lines.append("{:<32} {:>10} {:>10.3f} {:>10.3f} {:>10.1f}".format(
+                phase, row['calls'], row['seconds'], row['self_seconds'], row['us_per_call']))
+        return "\n".join(lines)
+
+def _wrap(func, phase, stats):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stats.enter(phase)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats.exit()
+    return wrapper
+
+_originals = []
+
+def enable(stats=None):
+    # Start recording into stats, a new Stats if None.  Return stats.
+    if _originals:
+        raise RuntimeError("Profiling is already enabled")
+    stats = stats if stats is not None else Stats()
+    for owner, name, phase in hot_paths():
+        func = vars(owner)[name]
+        _originals.append((owner, name, func))
+        setattr(owner, name, _wrap(func, phase, stats))
+    return stats
+
+def disable():
+    while _originals:
+        owner, name, func = _originals.pop()
+        setattr(owner, name, func)
+
+def is_enabled():
+    return bool(_originals)
+
+class enabled:
+    # Context manager profiling its block: with enabled() as stats: ...
+    def __init__(self, stats=None):
+        self.stats = stats
+
+    def __enter__(self):
+        return enable(self.stats)
+
+    def __exit__(self, *exc):
+        disable()
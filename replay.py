@@ -0,0 +1,150 @@
+# Replay of recorded games and reconstruction of their positions.
+# Usage: python replay.py games.azlog --out states.npy
+#
+# Positions are addressed by (game, ply): game is the index of the record in
+# the log and ply the number of moves played since the start of the game.
+# Ply 0 is the first position after the factories are filled, the last ply
+# is the finished game after endgame scoring.
+import argparse
+from bisect import bisect_right
+from collections import OrderedDict
+
+import numpy as np
+
+from model import Model
+from gamelog import GameLogReader
+from state import State, STATE_SIZE, STATE_DTYPE
+
+def iter_positions(record):
+    # Yield (ply, model) for every position of a GameRecord in order.
+    # The same Model is updated in place, copy it to keep a position.
+    model = Model.start()
+    ply = 0
+    for round in record.rounds:
+        model.setup_round(round.factories)
+        for move in round.moves:
+            yield ply, model
+            model.make_move(move)
+            ply += 1
+        model.cleanup_round()
+    model.score_endgame()
+    yield ply, model
+
+def round_starts(record):
+    # Ply at which every round starts and the State at that ply, stacked
+    plies = []
+    states = np.empty((len(record.rounds), STATE_SIZE), dtype=STATE_DTYPE)
+    model = Model.start()
+    ply = 0
+    for i, round in enumerate(record.rounds):
+        model.setup_round(round.factories)
+        plies.append(ply)
+        states[i] = State.from_model(model).data
+        for move in round.moves:
+            model.make_move(move)
+        ply += len(round.moves)
+        model.cleanup_round()
+    return plies, states
+
+def state_features(model):
+    return State.from_model(model).data
+
+class Replayer:
+    # Position lookup in a game log.  The record and round start States of
+    # the cache_size most recently used games are kept, so a position is
+    # rebuilt from the start of its round instead of the start of the game.
+    def __init__(self, log, cache_size=1024):
+        self.log = GameLogReader(log) if isinstance(log, str) else log
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    def game(self, game):
+        # Return the GameRecord, round start plies and States of a game
+        if game in self.cache:
+            self.cache.move_to_end(game)
+            return self.cache[game]
+        record = self.log[game]
+        entry = (record,) + round_starts(record)
+        self.cache[game] = entry
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return entry
+
+    def num_plies(self, game):
+        # Number of moves in game, its last ply
+        record, plies, _ = self.game(game)
+        return plies[-1] + len(record.rounds[-1].moves)
+
+    def round_model(self, game, round):
+        # A new Model at the start of a round
+        _, _, states = self.game(game)
+        return State(states[round]).to_model()
+
+    def advance(self, game, model, ply, target):
+        # Return a Model at the target ply of game.  model, at ply, is played
+        # on if it is earlier in the same round, otherwise play starts from a
+        # new Model at the start of the target's round.
+        record, plies, _ = self.game(game)
+        total = plies[-1] + len(record.rounds[-1].moves)
+        if not 0 <= target <= total:
+            raise IndexError("Ply {} out of range for game {} with {} plies".format(target, game, total))
+        round = bisect_right(plies, target) - 1
+        if model is None or ply == total or not plies[round] <= ply <= target:
+            model, ply = self.round_model(game, round), plies[round]
+        for move in record.rounds[round].moves[ply - plies[round]:target - plies[round]]:
+            model.make_move(move)
+        if target == total:
+            model.cleanup_round()
+            model.score_endgame()
+        return model
+
+    def position(self, game, ply):
+        # Return a new Model of the position at ply in game
+        return self.advance(game, None, None, ply)
+
+    def extract(self, positions=None, features=state_features, num_features=STATE_SIZE,
+                dtype=STATE_DTYPE):
+        # Return an array with features(model) for every requested position,
+        # one row per position in the order given.  positions is a list of
+        # (game, ply), or None for every position in the log.  Requested
+        # positions of a game are visited in ply order, starting from the
+        # round start before the first one.
+        if positions is None:
+            return self.extract_all(features, num_features, dtype)
+        out = np.empty((len(positions), num_features), dtype=dtype)
+        by_game = {}
+        for i, (game, ply) in enumerate(positions):
+            by_game.setdefault(game, []).append((ply, i))
+        for game, requests in by_game.items():
+            model = ply = None
+            for target, i in sorted(requests):
+                if model is None or target != ply:
+                    model, ply = self.advance(game, model, ply, target), target
+                out[i] = features(model)
+        return out
+
+    def extract_all(self, features=state_features, num_features=STATE_SIZE, dtype=STATE_DTYPE):
+        # features(model) for every position of every game, replaying each
+        # game once from the start
+        blocks = []
+        for record in self.log:
+            num_plies = sum(len(round.moves) for round in record.rounds) + 1
+            block = np.empty((num_plies, num_features), dtype=dtype)
+            for ply, model in iter_positions(record):
+                block[ply] = features(model)
+            blocks.append(block)
+        if not blocks:
+            return np.empty((0, num_features), dtype=dtype)
+        return np.concatenate(blocks)
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract the positions of a game log")
+    parser.add_argument('log')
+    parser.add_argument('--out', required=True, help=".npy file of one State array per position")
+    args = parser.parse_args()
+    states = Replayer(args.log).extract()
+    np.save(args.out, states)
+    print("{} positions written to {}".format(len(states), args.out))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+# Random playouts of many games at once with NumPy.
+# A Batch holds N independent games as arrays with the game index first, and
+# every step plays one uniformly random legal move in every unfinished game.
+# Round ends, end of round scoring, endgame bonuses and factory filling are
+# done for all games that reach them in the same step.
+# The rules follow model.Model, including where tiles over a pattern line's
+# capacity go to the floor line and where excess floor tiles go to the lid.
+import numpy as np
+
+from constants import *
+import evaluation
+from model import PLACEMENT_SCORE
+from state import (
+    State, STATE_SIZE, STATE_DTYPE, WALL, LINE_TILE, LINE_NUM, FLOOR, SCORE,
+    FACTORIES, CENTER, BAG, LID, NEXT_PLAYER, player_offset)
+
+NUM_SOURCES = NUM_FACTORIES + 1 # the factories, then the center
+NUM_LINES = NUM_TILES + 1       # the pattern lines, then the floor line
+FLOOR_LINE = NUM_TILES
+WHITE = NUM_TILES               # index of the first player tile in center counts
+ROUND_TILES = NUM_FACTORIES * TILES_PER_FACTORY
+
+ROWS = np.arange(NUM_TILES)
+# WALL_COLUMN[color, row] is the wall column of color index color on row
+WALL_COLUMN = (np.arange(NUM_TILES)[:, None] + ROWS[None, :]) % NUM_TILES
+# CELL_COLOR[row, col] is the color index of the wall cell
+CELL_COLOR = (ROWS[None, :] - ROWS[:, None]) % NUM_TILES
+PLACEMENT_SCORE = np.array(PLACEMENT_SCORE)
+
+def pack(models):
+    # Return the STATE_SIZE array of every model stacked into one array
+    return np.stack([State.from_model(model).data for model in models])
+
+class Batch:
+    # occupied      (N, NUM_PLAYERS, NUM_TILES, NUM_TILES) filled wall cells
+    # line_colors   (N, NUM_PLAYERS, NUM_TILES) color index on each pattern line, -1 if empty
+    # line_nums     (N, NUM_PLAYERS, NUM_TILES)
+    # floor_colors  (N, NUM_PLAYERS, NUM_TILES) colored tiles on each floor line
+    # floor_counts  (N, NUM_PLAYERS) all tiles on each floor line
+    # white_holder  (N,) player with the first player tile on their floor line, -1 if none
+    # scores        (N, NUM_PLAYERS)
+    # factories     (N, NUM_FACTORIES, NUM_TILES) tile counts
+    # center        (N, NUM_TILES+1) tile counts, the last one for the first player tile
+    # bag, lid      (N, NUM_TILES) tile counts
+    # next_player   (N,)
+    # done          (N,) games which are over
+    def __init__(self, states, rng=None):
+        # states is an (N, STATE_SIZE) array, see state.py and pack
+        self.rng = rng if rng is not None else np.random.default_rng()
+        states = np.asarray(states)
+        n = len(states)
+        players = [states[:, player_offset(p):player_offset(p+1)] for p in range(NUM_PLAYERS)]
+        self.occupied = np.stack([
+            p[:, WALL:LINE_TILE].reshape(n, NUM_TILES, NUM_TILES) != 0 for p in players], axis=1)
+        self.line_colors = np.stack([p[:, LINE_TILE:LINE_NUM] for p in players], axis=1).astype(int) - 1
+        self.line_nums = np.stack([p[:, LINE_NUM:FLOOR] for p in players], axis=1).astype(int)
+        floors = np.stack([p[:, FLOOR:SCORE] for p in players], axis=1).astype(int)
+        self.floor_colors = floors[:, :, :NUM_TILES]
+        self.floor_counts = floors.sum(axis=2)
+        self.white_holder = np.where(floors[:, :, WHITE].any(axis=1), floors[:, :, WHITE].argmax(axis=1), -1)
+        self.scores = np.stack([p[:, SCORE] for p in players], axis=1).astype(int)
+        self.factories = states[:, FACTORIES:CENTER].reshape(n, NUM_FACTORIES, NUM_TILES).astype(int)
+        self.center = states[:, CENTER:BAG].astype(int)
+        self.bag = states[:, BAG:LID].astype(int)
+        self.lid = states[:, LID:NEXT_PLAYER].astype(int)
+        self.next_player = states[:, NEXT_PLAYER].astype(int)
+        self.done = np.zeros(n, dtype=bool)
+
+    def __len__(self):
+        return len(self.done)
+
+    def to_states(self):
+        # Return the (N, STATE_SIZE) array of the current positions
+        n = len(self)
+        states = np.zeros((n, STATE_SIZE), dtype=STATE_DTYPE)
+        for p in range(NUM_PLAYERS):
+            offset = player_offset(p)
+            walls = np.where(self.occupied[:, p], CELL_COLOR + 1, 0)
+            states[:, offset+WALL:offset+LINE_TILE] = walls.reshape(n, -1)
+            states[:, offset+LINE_TILE:offset+LINE_NUM] = self.line_colors[:, p] + 1
+            states[:, offset+LINE_NUM:offset+FLOOR] = self.line_nums[:, p]
+            states[:, offset+FLOOR:offset+FLOOR+NUM_TILES] = self.floor_colors[:, p]
+            states[:, offset+FLOOR+WHITE] = self.white_holder == p
+            states[:, offset+SCORE] = self.scores[:, p]
+        states[:, FACTORIES:CENTER] = self.factories.reshape(n, -1)
+        states[:, CENTER:BAG] = self.center
+        states[:, BAG:LID] = self.bag
+        states[:, LID:NEXT_PLAYER] = self.lid
+        states[:, NEXT_PLAYER] = self.next_player
+        return states
+
+    def sources(self, idx):
+        # (M, NUM_SOURCES, NUM_TILES) colored tile counts of games idx
+        return np.concatenate([self.factories[idx], self.center[idx, None, :NUM_TILES]], axis=1)
+
+    def legal_moves(self, idx):
+        # (M, NUM_SOURCES, NUM_TILES, NUM_LINES) mask of the legal moves of games idx
+        players = self.next_player[idx]
+        line_colors = self.line_colors[idx, players]
+        line_nums = self.line_nums[idx, players]
+        occupied = self.occupied[idx, players]
+        open_lines = np.ones((len(idx), NUM_TILES, NUM_LINES), dtype=bool)
+        on_wall = occupied[:, ROWS[None, :], WALL_COLUMN] # [m, color, row]
+        open_lines[:, :, :NUM_TILES] = (
+            (line_nums < ROWS + 1)[:, None, :]
+            & ((line_colors[:, None, :] == -1) | (line_colors[:, None, :] == ROWS[:, None]))
+            & ~on_wall)
+        return (self.sources(idx) > 0)[:, :, :, None] & open_lines[:, None, :, :]
+
+    def random_moves(self, idx):
+        # Return (sources, colors, lines) of a uniformly random legal move in each of games idx
+        legal = self.legal_moves(idx)
+        keys = self.rng.random(legal.shape)
+        keys[~legal] = -1
+        choice = keys.reshape(len(idx), -1).argmax(axis=1)
+        return np.unravel_index(choice, legal.shape[1:])
+
+    def apply_moves(self, idx, sources, colors, lines):
+        # Play the move (source, color, line) in each of games idx, like Model.make_move.
+        # Source NUM_FACTORIES is the center and line NUM_TILES the floor line.
+        players = self.next_player[idx]
+        num_tiles = self.sources(idx)[np.arange(len(idx)), sources, colors]
+
+        from_factory = sources < NUM_FACTORIES
+        f_idx, f_src = idx[from_factory], sources[from_factory]
+        extras = self.factories[f_idx, f_src]
+        extras[np.arange(len(f_idx)), colors[from_factory]] = 0
+        self.center[f_idx, :NUM_TILES] += extras
+        self.factories[f_idx, f_src] = 0
+
+        from_center = ~from_factory
+        c_idx, c_players = idx[from_center], players[from_center]
+        self.center[c_idx, colors[from_center]] = 0
+        takes_white = self.center[c_idx, WHITE] > 0
+        self.floor_counts[c_idx[takes_white], c_players[takes_white]] += 1
+        self.white_holder[c_idx[takes_white]] = c_players[takes_white]
+        self.center[c_idx, WHITE] = 0
+
+        to_line = lines < FLOOR_LINE
+        l_idx, l_players, rows = idx[to_line], players[to_line], lines[to_line]
+        l_colors, l_num = colors[to_line], num_tiles[to_line]
+        added = np.minimum(l_num, rows + 1 - self.line_nums[l_idx, l_players, rows])
+        self.line_nums[l_idx, l_players, rows] += added
+        self.line_colors[l_idx, l_players, rows] = l_colors
+        overflow = l_num - added
+        self.floor_counts[l_idx, l_players] += overflow
+        self.floor_colors[l_idx, l_players, l_colors] += overflow
+
+        to_floor = ~to_line
+        fl_idx, fl_players = idx[to_floor], players[to_floor]
+        fl_colors, fl_num = colors[to_floor], num_tiles[to_floor]
+        placed = np.clip(FLOOR_CAPACITY - self.floor_counts[fl_idx, fl_players], 0, fl_num)
+        self.floor_counts[fl_idx, fl_players] += placed
+        self.floor_colors[fl_idx, fl_players, fl_colors] += placed
+        self.lid[fl_idx, fl_colors] += fl_num - placed
+
+        self.next_player[idx] = (players + 1) % NUM_PLAYERS
+
+    def round_over(self):
+        # Unfinished games without colored tiles left to take
+        return ~self.done & (self.factories.sum(axis=(1, 2)) == 0) & (self.center[:, :NUM_TILES].sum(axis=1) == 0)
+
+    def score_round(self, idx):
+        # End of round scoring of games idx, like Model.cleanup_round
+        n = len(idx)
+        for p in range(NUM_PLAYERS):
+            round_scores = np.zeros(n, dtype=int)
+            for row in range(NUM_TILES):
+                full = np.nonzero(self.line_nums[idx, p, row] == row + 1)[0]
+                if not len(full):
+                    continue
+                games = idx[full]
+                colors = self.line_colors[games, p, row]
+                cols = WALL_COLUMN[colors, row]
+                self.occupied[games, p, row, cols] = True
+                row_masks = self.occupied[games, p, row, :] @ evaluation.BITS
+                col_masks = self.occupied[games, p, :, cols] @ evaluation.BITS
+                round_scores[full] += PLACEMENT_SCORE[
+                    evaluation.RUN_LENGTH[row_masks, cols], evaluation.RUN_LENGTH[col_masks, row]]
+                self.lid[games, colors] += row
+                self.line_nums[games, p, row] = 0
+                self.line_colors[games, p, row] = -1
+            round_scores += evaluation.FLOOR_PENALTY[np.minimum(self.floor_counts[idx, p], FLOOR_CAPACITY)]
+            self.scores[idx, p] = np.maximum(self.scores[idx, p] + round_scores, 0)
+            self.lid[idx] += self.floor_colors[idx, p]
+            self.floor_colors[idx, p] = 0
+            self.floor_counts[idx, p] = 0
+        holders = self.white_holder[idx]
+        self.next_player[idx] = np.where(holders >= 0, holders, self.next_player[idx])
+        self.white_holder[idx] = -1
+        # a first player tile nobody took is put back
+        self.center[idx, WHITE] = 0
+
+    def score_endgame(self, idx):
+        occupied = self.occupied[idx]
+        rows = occupied.all(axis=3).sum(axis=2)
+        cols = occupied.all(axis=2).sum(axis=2)
+        colors = occupied[:, :, ROWS[None, :], WALL_COLUMN].all(axis=3).sum(axis=2)
+        self.scores[idx] += ALL_TILES_BONUS*colors + COLUMN_BONUS*cols + ROW_BONUS*rows
+
+    def fill_factories(self, idx):
+        # Start a new round in games idx, like Model.setup_round: draw the
+        # factory tiles one at a time for all games together, putting the
+        # lid into the bag of games whose bag runs out.  Tile by tile draws
+        # give the same multivariate hypergeometric factories as Model, and
+        # are cheaper over many games than numpy's sampler row by row.
+        bag = self.bag[idx]
+        lid = self.lid[idx]
+        factories = np.zeros((len(idx), NUM_FACTORIES, NUM_TILES), dtype=int)
+        rows = np.arange(len(idx))
+        for i in range(ROUND_TILES):
+            totals = bag.sum(axis=1)
+            refill = totals == 0
+            if refill.any():
+                bag[refill] += lid[refill]
+                lid[refill] = 0
+                totals = bag.sum(axis=1)
+            drawing = totals > 0
+            picks = np.floor(self.rng.random(len(idx)) * totals).astype(int)
+            colors = (picks[:, None] >= bag.cumsum(axis=1)).sum(axis=1)
+            colors = np.minimum(colors, NUM_TILES - 1)
+            factories[rows[drawing], i // TILES_PER_FACTORY, colors[drawing]] += 1
+            bag[rows[drawing], colors[drawing]] -= 1
+        self.bag[idx] = bag
+        self.lid[idx] = lid
+        self.factories[idx] = factories
+        self.center[idx] = 0
+        self.center[idx, WHITE] = 1
+
+    def end_rounds(self, idx):
+        self.score_round(idx)
+        game_over = (self.occupied[idx].all(axis=3)).any(axis=(1, 2))
+        finished = idx[game_over]
+        self.score_endgame(finished)
+        self.done[finished] = True
+        self.fill_factories(idx[~game_over])
+
+    def play(self):
+        # Play every game to the end and return the final scores
+        while not self.done.all():
+            over = np.nonzero(self.round_over())[0]
+            if len(over):
+                self.end_rounds(over)
+            playing = np.nonzero(~self.done & ~self.round_over())[0]
+            if len(playing):
+                self.apply_moves(playing, *self.random_moves(playing))
+        return self.scores
+
+def rollout(states, rng=None):
+    # Play random games to the end from each of the (N, STATE_SIZE) states.
+    # Return the (N, NUM_PLAYERS) final scores.
+    return Batch(states, rng).play()
+
+def win_rates(model, num_games, rng=None):
+    # Fraction of num_games random playouts from model won by each player,
+    # counting ties as half a win
+    scores = rollout(np.repeat(pack([model]), num_games, axis=0), rng)
+    best = scores.max(axis=1, keepdims=True)
+    winners = scores == best
+    return (winners / winners.sum(axis=1, keepdims=True)).mean(axis=0)
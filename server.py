@@ -0,0 +1,355 @@
+# Game server for bots playing over the network.
+# Usage: python server.py [--host 127.0.0.1 --port 7777 | --unix /tmp/azul.sock]
+#        [--timeout 10] [--think-time 0.1] [--processes] [--record games.azlog]
+#
+# Every connection speaks JSON lines, one object per line with a "type".
+# A connection can play any number of games at once, every message about a
+# game carries its "game" id.
+#
+# client -> server
+#   {"type": "play", "opponent": "heuristic"}  a game against a computer
+#       player of the server, any name of players.PLAYERS, or "remote" to be
+#       matched with the next other connection asking for a remote opponent.
+#       Optional: "seat" (0 or 1, default random), "seed" (int), "request"
+#       (any value, echoed in the 'started' or 'error' answer to tell
+#       requests apart).  Between two remote players the seat and seed of
+#       the first one to ask count.
+#   {"type": "move", "game": 3, "move": [factory, tile, pattern_line]}
+#       factory -1 is the center, pattern_line -1 the floor line and tile
+#       the Tile value, as in model.Move.
+# server -> client
+#   {"type": "started", "game": 3, "seat": 0, "opponent": "heuristic", "seed": 12,
+#    "request": 7}
+#   {"type": "state", "game": 3, "seat": 0, "state": [...], "moves": [[...], ...],
+#    "timeout": 10.0}  the client is to move.  state is the State data of
+#       the position, see state.py, moves the legal moves.
+#   {"type": "over", "game": 3, "scores": [31, 24], "winner": 0,
+#    "reason": "finished" | "timeout" | "illegal move" | "disconnected" | "server error"}
+#       winner is null after a server error.
+#   {"type": "error", "message": "...", "request": 7}  for a message that
+#       was not understood or a game that could not be started, with the
+#       request of that message if it had one
+#
+# A client which does not answer within the timeout, sends an illegal move or
+# disconnects loses the game.  Computer players of the server move in an
+# executor, so thousands of games can wait on their clients at once.
+import argparse
+import asyncio
+import json
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from constants import *
+from gamelog import GameLogWriter, GameRecorder
+from model import Model, Move, Tile
+from players import close_player, computer_move, player_class
+from simulate import game_seed
+from state import State
+
+REMOTE = 'remote'
+
+def encode_move(move):
+    return [int(move.factory), move.tile.value, int(move.pattern_line)]
+
+def decode_move(data):
+    # Move from its JSON list, ValueError if it is not one
+    if not isinstance(data, list) or len(data) != 3 or not all(isinstance(x, int) for x in data):
+        raise ValueError("A move is [factory, tile, pattern_line], got {!r}".format(data))
+    factory, tile, pattern_line = data
+    return Move(factory, Tile(tile), pattern_line)
+
+def state_message(game, seat, model, timeout):
+    return {
+        'type': 'state', 'game': game, 'seat': seat,
+        'state': State.from_model(model).data.tolist(),
+        'moves': [encode_move(move) for move in model.legal_moves()],
+        'timeout': timeout,
+    }
+
+class Forfeit(Exception):
+    # Raised by a seat which lost the game, the message is the reason
+    pass
+
+class Connection:
+    # A client connection.  pending[game] is the future of the move the
+    # client is asked for in that game.
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.pending = {}
+        self.closed = False
+
+    async def send(self, message):
+        if self.closed:
+            return
+        self.writer.write(json.dumps(message).encode() + b'\n')
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            self.close()
+
+    async def serve(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                message = None
+                try:
+                    message = json.loads(line)
+                    if not isinstance(message, dict):
+                        raise ValueError("Messages are JSON objects")
+                    await self.handle(message)
+                except Exception as e:
+                    # a bad message only fails itself, not the connection
+                    error = {'type': 'error', 'message': str(e) or type(e).__name__}
+                    if isinstance(message, dict) and 'request' in message:
+                        error['request'] = message['request']
+                    await self.send(error)
+        except ConnectionError:
+            pass
+        finally:
+            self.close()
+
+    async def handle(self, message):
+        kind = message.get('type')
+        if kind == 'play':
+            await self.server.new_game(self, message)
+        elif kind == 'move':
+            future = self.pending.get(message['game'])
+            if future is None or future.done():
+                raise ValueError("Not your move in game {}".format(message['game']))
+            future.set_result(message['move'])
+        else:
+            raise ValueError("Unknown message type {!r}".format(kind))
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(Forfeit('disconnected'))
+        self.writer.close()
+
+class Remote_Seat:
+    # A seat played by a client
+    name = REMOTE
+
+    def __init__(self, connection, timeout, request):
+        self.connection = connection
+        self.timeout = timeout
+        self.request = request # the 'play' message
+
+    async def started(self, game, seat, opponent, seed):
+        message = {'type': 'started', 'game': game, 'seat': seat, 'opponent': opponent, 'seed': seed}
+        if 'request' in self.request:
+            message['request'] = self.request['request']
+        await self.connection.send(message)
+
+    async def move(self, game, seat, model):
+        if self.connection.closed:
+            raise Forfeit('disconnected')
+        future = asyncio.get_running_loop().create_future()
+        self.connection.pending[game] = future
+        try:
+            await self.connection.send(state_message(game, seat, model, self.timeout))
+            data = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise Forfeit('timeout')
+        finally:
+            del self.connection.pending[game]
+        try:
+            move = decode_move(data)
+        except ValueError:
+            raise Forfeit('illegal move')
+        if move not in model.legal_moves():
+            raise Forfeit('illegal move')
+        return move
+
+    async def over(self, message):
+        await self.connection.send(message)
+
+class Computer_Seat:
+    # A seat played by a computer player of the server
+    def __init__(self, name, player, executor):
+        self.name = name
+        self.player = player
+        self.executor = executor
+
+    async def started(self, game, seat, opponent, seed):
+        pass
+
+    async def move(self, game, seat, model):
+        loop = asyncio.get_running_loop()
+        move, self.player = await loop.run_in_executor(
+            self.executor, computer_move, self.player, model.copy())
+        return move
+
+    async def over(self, message):
+        close_player(self.player)
+
+class Server:
+    # Hosts the games of all connections.  Computer players move in a pool
+    # of worker threads, or worker processes if processes is True.
+    # timeout is the seconds a client has for every move, think_time the
+    # time limit of computer players which have one.  If log_path is given,
+    # every finished game is appended to that game log.
+    def __init__(self, timeout=10.0, think_time=0.1, processes=False, workers=None,
+                 log_path=None, seed=None):
+        self.timeout = timeout
+        self.think_time = think_time
+        workers = workers or os.cpu_count()
+        self.executor = ProcessPoolExecutor(workers) if processes else ThreadPoolExecutor(workers)
+        self.writer = GameLogWriter(log_path) if log_path is not None else None
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+        self.next_game = 0
+        self.waiting = [] # Remote_Seats waiting for a remote opponent
+        self.tasks = set()
+        self.finished = 0 # games over, reported on shutdown
+
+    def new_player(self, cls, rng):
+        player = cls(rng=rng)
+        if hasattr(player, 'time_limit'):
+            player.time_limit = self.think_time
+        return player
+
+    async def new_game(self, connection, message):
+        # Start the game asked for by a 'play' message, or queue it until
+        # another connection asks for a remote opponent
+        opponent = message.get('opponent', 'heuristic')
+        if message.get('seat') not in (None, 0, 1):
+            raise ValueError("seat is 0, 1 or absent")
+        remote = Remote_Seat(connection, self.timeout, message)
+        if opponent == REMOTE:
+            self.waiting = [waiting for waiting in self.waiting if not waiting.connection.closed]
+            other = next((waiting for waiting in self.waiting if waiting.connection is not connection), None)
+            if other is None:
+                self.waiting.append(remote)
+                return
+            self.waiting.remove(other)
+            # the request of the waiting seat decides seat and seed
+            seats = [other, remote]
+            remote = other
+        else:
+            seats = [remote, player_class(opponent)]
+        request = remote.request
+        game = self.next_game
+        self.next_game += 1
+        # A game with a seed given by the client is the same whatever its id,
+        # otherwise it is game_seed(self.seed, game) like in simulate.py
+        if 'seed' in request:
+            seed = int(request['seed'])
+            model_seed, player_seed, seat_seed = game_seed(seed, 0).spawn(3)
+        else:
+            seed = self.seed
+            model_seed, player_seed, seat_seed = game_seed(seed, game).spawn(3)
+        if opponent != REMOTE:
+            player = self.new_player(seats[1], np.random.default_rng(player_seed))
+            seats[1] = Computer_Seat(opponent, player, self.executor)
+        seat = request.get('seat')
+        if seat is None:
+            seat = int(np.random.default_rng(seat_seed).integers(NUM_PLAYERS))
+        if seats[seat] is not remote:
+            seats.reverse()
+        task = asyncio.ensure_future(self.play(game, seed, seats, np.random.default_rng(model_seed)))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def play(self, game, seed, seats, rng):
+        # Play a game between seats, seats[i] in seat i
+        for i, seat in enumerate(seats):
+            await seat.started(game, i, seats[1 - i].name, seed)
+        model = Model.start(rng)
+        recorder = GameRecorder(game, seed) if self.writer else None
+        reason = 'finished'
+        loser = None
+        try:
+            while True:
+                model.setup_round()
+                if recorder:
+                    recorder.start_round(model)
+                while not model.round_over():
+                    player = model.next_player
+                    move = await seats[player].move(game, player, model)
+                    if recorder:
+                        recorder.record_move(move)
+                    model.make_move(move)
+                model.cleanup_round()
+                if model.game_over():
+                    model.score_endgame()
+                    break
+        except Forfeit as e:
+            reason, loser = str(e), model.next_player
+        except Exception:
+            # e.g. a computer player failed, the game ends without a winner
+            traceback.print_exc()
+            reason = 'server error'
+        scores = [int(board.score) for board in model.boards]
+        if reason == 'server error':
+            winner = None
+        else:
+            winner = model.winner() if loser is None else 1 - loser
+        if recorder and reason == 'finished':
+            self.writer.write(recorder.finish(model))
+            self.writer.flush()
+        self.finished += 1
+        message = {'type': 'over', 'game': game, 'scores': scores, 'winner': winner, 'reason': reason}
+        for seat in seats:
+            await seat.over(message)
+
+    async def connected(self, reader, writer):
+        await Connection(self, reader, writer).serve()
+
+    async def start(self, host='127.0.0.1', port=7777, unix=None):
+        # Start listening, on the Unix socket at path unix if given
+        if unix is not None:
+            return await asyncio.start_unix_server(self.connected, path=unix, limit=2**20)
+        return await asyncio.start_server(self.connected, host, port, limit=2**20)
+
+    def close(self):
+        for task in self.tasks:
+            task.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.writer:
+            self.writer.close()
+
+async def serve(args):
+    server = Server(args.timeout, args.think_time, args.processes, args.workers, args.record, args.seed)
+    listener = await server.start(args.host, args.port, args.unix)
+    print("Serving on {}".format(args.unix or "{}:{}".format(args.host, args.port)))
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+        print("Served {} games".format(server.finished))
+
+def main():
+    parser = argparse.ArgumentParser(description="Host Azul games for bots over JSON lines")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--unix', metavar='PATH', default=None,
+                        help="listen on this Unix socket instead of TCP")
+    parser.add_argument('--timeout', type=float, default=10.0,
+                        help="seconds a client may take for a move")
+    parser.add_argument('--think-time', type=float, default=0.1,
+                        help="seconds the server's players may think per move, for players with a time limit")
+    parser.add_argument('--processes', action='store_true',
+                        help="let the server's players think in processes instead of threads")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="default: all cores")
+    parser.add_argument('--record', metavar='PATH', default=None,
+                        help="append every finished game to this game log")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+# Headless simulation of complete games between computer players.
+# Usage: python simulate.py heuristic random --games 1000 --workers 8 [--record games.azlog]
+#        [--profile prefix]
+import argparse
+import os
+import time
+from collections import namedtuple
+from multiprocessing import Pool
+
+import numpy as np
+
+from constants import *
+from gamelog import GameLogWriter, GameRecorder
+import profiling
+from model import Model
+from players import PLAYERS, close_player, needs_main_process, player_class
+
+# scores and winner are given in the order of the player classes passed to
+# run_games, whatever seats they played in.  first is the index of the class
+# which played in seat 0.  seed is the seed of the run, game_seed(seed, game)
+# gives the seed of this game.
+GameResult = namedtuple('GameResult', ['game', 'seed', 'scores', 'winner', 'first', 'num_moves'])
+
+def game_seed(seed, game):
+    # SeedSequence of game number game in a run with the given seed, the same
+    # as np.random.SeedSequence(seed).spawn(n)[game] for any n > game
+    return np.random.SeedSequence(seed, spawn_key=(game,))
+
+def play_game(players, model=None, recorder=None):
+    # Play a complete game where players[i] moves for player i.
+    # recorder is an optional gamelog.GameRecorder which is given every round
+    # and move.  Return the finished Model and the number of moves played.
+    if model is None:
+        model = Model.start()
+    num_moves = 0
+    while True:
+        model.setup_round()
+        if recorder:
+            recorder.start_round(model)
+        while not model.round_over():
+            move = players[model.next_player].move(model)
+            if recorder:
+                recorder.record_move(move)
+            model.make_move(move)
+            num_moves += 1
+        model.cleanup_round()
+        if model.game_over():
+            model.score_endgame()
+            return model, num_moves
+
+def play_games(player_classes, games, seed, alternate_seats, record=False, profile=False):
+    # Play the games with the given indices.  The Model and the players of
+    # every game get generators spawned from the game's own seed, so any game
+    # can be replayed on its own and parallel games are independent.
+    # Return the GameResults, the encoded game records if record is set and
+    # the profiling.Stats of the games if profile is set.
+    results, records = [], []
+    stats = profiling.enable() if profile else None
+    try:
+        play_seeded_games(player_classes, games, seed, alternate_seats, record, results, records)
+    finally:
+        if profile:
+            profiling.disable()
+    return results, records, stats
+
+def play_seeded_game(player_classes, seed, index, first, recorder=None):
+    # Play game number index of a run with the given seed, with
+    # player_classes[first] in seat 0 and the others after it in order.
+    # The Model and the players get generators spawned from
+    # game_seed(seed, index), the same whatever the seats.
+    # Return the finished Model and the GameResult.
+    seats = [(first + i) % NUM_PLAYERS for i in range(NUM_PLAYERS)]
+    model_seed, *player_seeds = game_seed(seed, index).spawn(1 + len(player_classes))
+    players = [cls(rng=np.random.default_rng(player_seed))
+               for cls, player_seed in zip(player_classes, player_seeds)]
+    try:
+        model, num_moves = play_game(
+            [players[i] for i in seats], Model.start(np.random.default_rng(model_seed)), recorder)
+    finally:
+        for player in players:
+            close_player(player)
+    scores = [0] * NUM_PLAYERS
+    for seat, i in enumerate(seats):
+        scores[i] = int(model.boards[seat].score)
+    return model, GameResult(index, seed, scores, seats[model.winner()], first, num_moves)
+
+def play_seeded_games(player_classes, games, seed, alternate_seats, record, results, records):
+    for game in games:
+        first = game % NUM_PLAYERS if alternate_seats else 0
+        recorder = GameRecorder(game, seed) if record else None
+        model, result = play_seeded_game(player_classes, seed, game, first, recorder)
+        if record:
+            records.append(recorder.finish(model))
+        results.append(result)
+
+def _play_games(args):
+    return play_games(*args)
+
+def run_games(player_classes, num_games, workers=None, seed=None, chunk_size=50,
+              alternate_seats=True, record=None, stats=None):
+    # Play num_games games between player_classes on a pool of workers processes.
+    # Every game is seeded with game_seed(seed, game), so results do not
+    # depend on how games land on workers.  A random seed is chosen if seed
+    # is None, it is recorded in every GameResult.
+    # If record is a path, every game is appended to that game log as soon as
+    # its chunk finishes.  If stats is a profiling.Stats, the games are
+    # profiled and the counts of all workers added to it.
+    # Players with their own process pool play in this process.
+    # Return the list of GameResults in game order.
+    workers = workers or os.cpu_count()
+    if any(needs_main_process(cls) for cls in player_classes):
+        workers = 1
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    chunks = [range(start, min(start + chunk_size, num_games))
+              for start in range(0, num_games, chunk_size)]
+    tasks = [(player_classes, chunk, seed, alternate_seats, record is not None, stats is not None)
+             for chunk in chunks]
+    writer = GameLogWriter(record) if record is not None else None
+    pool = Pool(workers) if workers > 1 else None
+    try:
+        chunk_results = pool.imap_unordered(_play_games, tasks) if pool else map(_play_games, tasks)
+        results = []
+        for chunk, records, chunk_stats in chunk_results:
+            results += chunk
+            for game_record in records:
+                writer.write(game_record)
+            if chunk_stats:
+                stats.merge(chunk_stats)
+    finally:
+        if pool:
+            pool.terminate()
+        if writer:
+            writer.close()
+    return sorted(results, key=lambda result: result.game)
+
+def summarize(results, elapsed):
+    # Return a dict of aggregate statistics for a list of GameResults
+    scores = np.array([result.scores for result in results])
+    winners = np.array([result.winner for result in results])
+    draws = np.sum(scores.max(axis=1) == scores.min(axis=1))
+    summary = {
+        'seed': results[0].seed if results else None,
+        'games': len(results),
+        'seconds': elapsed,
+        'games_per_second': len(results) / elapsed,
+        'moves_per_game': float(np.mean([result.num_moves for result in results])),
+        'draws': int(draws),
+        'players': [],
+    }
+    for i in range(scores.shape[1]):
+        summary['players'].append({
+            'win_rate': float(np.mean(winners == i)),
+            'score_mean': float(scores[:, i].mean()),
+            'score_std': float(scores[:, i].std()),
+            'score_percentiles': {
+                str(p): float(v) for p, v in zip(
+                    [0, 10, 50, 90, 100], np.percentile(scores[:, i], [0, 10, 50, 90, 100]))},
+        })
+    return summary
+
+def format_summary(names, summary):
+    lines = ["{} games in {:.1f} s ({:.1f} games/s, {:.1f} moves/game, {} draws), seed {}".format(
+        summary['games'], summary['seconds'], summary['games_per_second'],
+        summary['moves_per_game'], summary['draws'], summary['seed'])]
+    for name, stats in zip(names, summary['players']):
+        p = stats['score_percentiles']
+        lines.append(
+            "  {:<12} win {:6.1%}  score mean {:5.1f} sd {:4.1f}  "
+            "min {:.0f} p10 {:.0f} p50 {:.0f} p90 {:.0f} max {:.0f}".format(
+                name, stats['win_rate'], stats['score_mean'], stats['score_std'],
+                p['0'], p['10'], p['50'], p['90'], p['100']))
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Play computer players against each other")
+    parser.add_argument('players', nargs=2, help="one of: " + ", ".join(PLAYERS))
+    parser.add_argument('-n', '--games', type=int, default=100)
+    parser.add_argument('-j', '--workers', type=int, default=None, help="default: all cores")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=50)
+    parser.add_argument('--fixed-seats', action='store_true',
+                        help="always give the first player seat 0 instead of alternating")
+    parser.add_argument('--record', metavar='PATH', default=None,
+                        help="append every game to this game log")
+    parser.add_argument('--profile', metavar='PREFIX', default=None,
+                        help="profile the games, write PREFIX.json and PREFIX.folded")
+    args = parser.parse_args()
+    player_classes = [player_class(name) for name in args.players]
+    stats = profiling.Stats() if args.profile else None
+    start = time.perf_counter()
+    results = run_games(
+        player_classes, args.games, args.workers, args.seed,
+        args.chunk_size, not args.fixed_seats, args.record, stats)
+    summary = summarize(results, time.perf_counter() - start)
+    print(format_summary(args.players, summary))
+    if stats:
+        stats.write_json(args.profile + '.json')
+        stats.write_collapsed(args.profile + '.folded')
+        print(stats.format())
+
+if __name__ == '__main__':
+    main()
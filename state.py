@@ -0,0 +1,153 @@
+# Compact array-backed game state.
+import numpy as np
+
+from constants import *
+from model import Model, PlayerBoard, PatternLine, Tile
+
+TILES = list(Tile)
+NUM_TILE_TYPES = len(TILES) # colored tiles plus the white first player tile
+
+# Layout of one player's block
+WALL = 0                                # NUM_TILES*NUM_TILES wall tile values
+LINE_TILE = WALL + NUM_TILES*NUM_TILES  # tile value on each pattern line, 0 if empty
+LINE_NUM = LINE_TILE + NUM_TILES        # number of tiles on each pattern line
+FLOOR = LINE_NUM + NUM_TILES            # floor line count for every tile type
+SCORE = FLOOR + NUM_TILE_TYPES
+PLAYER_SIZE = SCORE + 1
+
+# Layout of the whole state
+PLAYERS = 0
+FACTORIES = PLAYERS + NUM_PLAYERS*PLAYER_SIZE      # NUM_FACTORIES-by-NUM_TILES counts
+CENTER = FACTORIES + NUM_FACTORIES*NUM_TILES       # counts for every tile type
+BAG = CENTER + NUM_TILE_TYPES                      # draw pile counts
+LID = BAG + NUM_TILES                              # discard pile counts
+NEXT_PLAYER = LID + NUM_TILES
+STATE_SIZE = NEXT_PLAYER + 1
+
+STATE_DTYPE = np.int16
+
+def count_tiles(tiles, num_types=NUM_TILES):
+    # Return an array with the number of tiles of each type in the list tiles
+    counts = np.zeros(num_types, dtype=STATE_DTYPE)
+    for tile in tiles:
+        counts[tile.value - 1] += 1
+    return counts
+
+def tiles_from_counts(counts):
+    # Inverse of count_tiles: a list of tiles in Tile order
+    tiles = []
+    for tile, num in zip(TILES, counts.tolist()):
+        tiles += [tile] * num
+    return tiles
+
+def player_offset(player):
+    return PLAYERS + player*PLAYER_SIZE
+
+class State:
+    # A whole game position packed into one flat STATE_SIZE integer array,
+    # so that copying or hashing a position is a single buffer operation.
+    # Piles (factories, center, floor lines, draw and discard piles) are kept
+    # as per-tile counts.  The order of tiles within a pile is not stored,
+    # no rule of the game depends on it.
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros(STATE_SIZE, dtype=STATE_DTYPE))
+
+    @classmethod
+    def from_model(cls, model, data=None):
+        # data is an optional STATE_SIZE array to write to, e.g. a row of a
+        # preallocated batch
+        if data is None:
+            state = cls.empty()
+        else:
+            data[:] = 0
+            state = cls(data)
+        data = state.data
+        for player, board in enumerate(model.boards):
+            offset = player_offset(player)
+            data[offset+WALL:offset+LINE_TILE] = board.wall.ravel()
+            for row, line in enumerate(board.pattern_lines):
+                data[offset+LINE_TILE+row] = line.tile.value if line.tile else 0
+                data[offset+LINE_NUM+row] = line.num
+            data[offset+FLOOR:offset+SCORE] = count_tiles(board.floor_line, NUM_TILE_TYPES)
+            data[offset+SCORE] = board.score
+        for i, factory in enumerate(model.factories):
+            state.factories[i] = count_tiles(factory)
+        data[CENTER:BAG] = count_tiles(model.center, NUM_TILE_TYPES)
+        data[BAG:LID] = model.draw_pile
+        data[LID:NEXT_PLAYER] = model.discard_pile
+        data[NEXT_PLAYER] = model.next_player
+        return state
+
+    def to_model(self, rng=None):
+        boards = []
+        for player in range(NUM_PLAYERS):
+            wall = self.wall(player).astype(int)
+            pattern_lines = [
+                PatternLine(row+1, Tile(tile) if tile else None, num)
+                for row, (tile, num) in enumerate(zip(
+                    self.line_tiles(player).tolist(), self.line_nums(player).tolist()))]
+            floor_line = tiles_from_counts(self.floor(player))
+            boards.append(PlayerBoard(wall, self.score(player), pattern_lines, floor_line))
+        return Model(
+            boards,
+            [tiles_from_counts(factory) for factory in self.factories],
+            tiles_from_counts(self.center),
+            self.bag.astype(int),
+            self.lid.astype(int),
+            self.next_player,
+            rng)
+
+    def copy(self):
+        return State(self.data.copy())
+
+    def __eq__(self, other):
+        return isinstance(other, State) and np.array_equal(self.data, other.data)
+
+    def __hash__(self):
+        return hash(self.data.tobytes())
+
+    # Views into data.  Writing to a view updates the state.
+    def wall(self, player):
+        offset = player_offset(player)
+        return self.data[offset+WALL:offset+LINE_TILE].reshape(NUM_TILES, NUM_TILES)
+
+    def line_tiles(self, player):
+        offset = player_offset(player)
+        return self.data[offset+LINE_TILE:offset+LINE_NUM]
+
+    def line_nums(self, player):
+        offset = player_offset(player)
+        return self.data[offset+LINE_NUM:offset+FLOOR]
+
+    def floor(self, player):
+        offset = player_offset(player)
+        return self.data[offset+FLOOR:offset+SCORE]
+
+    def score(self, player):
+        return int(self.data[player_offset(player)+SCORE])
+
+    @property
+    def factories(self):
+        return self.data[FACTORIES:CENTER].reshape(NUM_FACTORIES, NUM_TILES)
+
+    @property
+    def center(self):
+        return self.data[CENTER:BAG]
+
+    @property
+    def bag(self):
+        return self.data[BAG:LID]
+
+    @property
+    def lid(self):
+        return self.data[LID:NEXT_PLAYER]
+
+    @property
+    def next_player(self):
+        return int(self.data[NEXT_PLAYER])
@@ -0,0 +1,236 @@
+# Tournaments between computer players with sequential early stopping.
+# Usage: python tournament.py heuristic learned random [--gauntlet] [--workers 8]
+#
+# Games are played in pairs: both games of a pair start from the same
+# seeded Model, so they deal the same first round and draw the later rounds
+# from the same random stream, with the players in swapped seats.  Pair p
+# uses simulate.game_seed(seed, p) in every pairing, so all pairings are
+# played on the same deals.
+# Every pairing is stopped as soon as a sequential probability ratio test
+# on the pair scores accepts H0 (Elo difference elo0) or H1 (elo1), or after
+# max_pairs pairs.  The test is the generalized SPRT on the pentanomial
+# distribution of pair scores, with the log-likelihood ratio approximated by
+# LLR = n (s1 - s0) (2 mean - s0 - s1) / (2 var)
+# where s0 and s1 are the expected scores for elo0 and elo1.
+import argparse
+import itertools
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from constants import *
+from players import PLAYERS, needs_main_process, player_class
+from simulate import play_seeded_game
+
+assert NUM_PLAYERS == 2, "Tournaments pair two players"
+
+# Pair scores 0, 1/4, 1/2, 3/4, 1 of the first player of a pairing
+PAIR_SCORES = np.arange(5) / 4
+# Pseudo-count of every pair score in the variance, so that a few pairs with
+# the same outcome do not make the variance 0
+VARIANCE_PRIOR = 0.5
+# Normal quantile of the two-sided 95% confidence intervals
+Z_95 = 1.959964
+
+def expected_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+def elo_difference(score):
+    # Elo difference giving an expected score of score, infinite at 0 and 1
+    if score <= 0:
+        return -np.inf
+    if score >= 1:
+        return np.inf
+    return -400 * np.log10(1 / score - 1)
+
+def score_variance(counts):
+    # Variance of the pair scores with VARIANCE_PRIOR added to every count
+    prior = counts + VARIANCE_PRIOR
+    mean = prior @ PAIR_SCORES / prior.sum()
+    return prior @ (PAIR_SCORES - mean) ** 2 / prior.sum()
+
+def play_pair(player_classes, seed, pair):
+    # Play both games of a pair, the first with player_classes[0] in seat 0.
+    # Return their GameResults, scores and winner in the order of player_classes.
+    results = []
+    for first in range(NUM_PLAYERS):
+        _, result = play_seeded_game(player_classes, seed, pair, first)
+        results.append(result._replace(game=2 * pair + first))
+    return results
+
+def _play_pair(args):
+    pairing, player_classes, seed, pair = args
+    return pairing, pair, play_pair(player_classes, seed, pair)
+
+def game_score(result):
+    # 1 for a win of the first player, 1/2 for equal scores, 0 for a loss
+    if result.scores[0] == result.scores[1]:
+        return 0.5
+    return 1.0 if result.winner == 0 else 0.0
+
+class SPRT:
+    # Sequential test of H0: Elo difference elo0 against H1: elo1, with
+    # false positive rate alpha and false negative rate beta
+    def __init__(self, elo0=0.0, elo1=30.0, alpha=0.05, beta=0.05):
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.lower = np.log(beta / (1 - alpha))
+        self.upper = np.log((1 - beta) / alpha)
+
+    def llr(self, counts):
+        # Log-likelihood ratio of the pentanomial counts of pair scores
+        n = counts.sum()
+        if n == 0:
+            return 0.0
+        mean = counts @ PAIR_SCORES / n
+        var = score_variance(counts)
+        s0, s1 = expected_score(self.elo0), expected_score(self.elo1)
+        return float(n * (s1 - s0) * (2 * mean - s0 - s1) / (2 * var))
+
+    def decision(self, llr):
+        # 'H1', 'H0' or None while the test goes on
+        if llr >= self.upper:
+            return 'H1'
+        if llr <= self.lower:
+            return 'H0'
+        return None
+
+class Pairing:
+    # The running results of names[0] against names[1]
+    def __init__(self, names):
+        self.names = names
+        self.counts = np.zeros(len(PAIR_SCORES), dtype=np.int64)
+        self.wins = self.draws = self.losses = 0
+        self.llr = 0.0
+        self.decision = None
+        self.done = False
+
+    def add(self, results, sprt):
+        # Add the two GameResults of the next pair and test
+        scores = [game_score(result) for result in results]
+        for score in scores:
+            self.wins += score == 1
+            self.draws += score == 0.5
+            self.losses += score == 0
+        self.counts[int(round(2 * sum(scores)))] += 1
+        self.llr = sprt.llr(self.counts)
+        self.decision = sprt.decision(self.llr)
+        self.done = self.decision is not None
+
+    @property
+    def pairs(self):
+        return int(self.counts.sum())
+
+    def elo(self):
+        # Elo difference of names[0] over names[1] and its 95% confidence interval
+        n = self.pairs
+        mean = self.counts @ PAIR_SCORES / n
+        margin = Z_95 * np.sqrt(score_variance(self.counts) / n)
+        return elo_difference(mean), elo_difference(mean - margin), elo_difference(mean + margin)
+
+    def as_dict(self):
+        elo, low, high = self.elo()
+        return {
+            'players': list(self.names),
+            'games': 2 * self.pairs,
+            'wins': int(self.wins), 'draws': int(self.draws), 'losses': int(self.losses),
+            'score': float(self.counts @ PAIR_SCORES / self.pairs),
+            'elo': elo, 'elo_low': low, 'elo_high': high,
+            'llr': self.llr, 'decision': self.decision,
+        }
+
+def pairings(names, gauntlet=False):
+    # Every pair of names in a round robin, or names[0] against each of the
+    # others in a gauntlet
+    if gauntlet:
+        return [(names[0], name) for name in names[1:]]
+    return list(itertools.combinations(names, 2))
+
+def run_tournament(names, gauntlet=False, sprt=None, max_pairs=1000, workers=None, seed=None,
+                   batch_size=None, progress=None):
+    # Play the pairings of names until every one is decided by sprt or has
+    # played max_pairs pairs.  Pairs are played in batches of batch_size
+    # per undecided pairing, default one per worker, and added in pair order,
+    # so results do not depend on the number of workers.  progress is called
+    # with every Pairing after each of its pairs.  Players with their own
+    # process pool play in this process.
+    # Return the seed and the list of Pairings.
+    sprt = sprt or SPRT()
+    workers = workers or os.cpu_count()
+    if any(needs_main_process(player_class(name)) for name in names):
+        workers = 1
+    batch_size = batch_size or workers
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    classes = {name: player_class(name) for name in names}
+    running = [Pairing(pair_names) for pair_names in pairings(names, gauntlet)]
+    all_pairings = list(running)
+    pool = Pool(workers) if workers > 1 else None
+    try:
+        while running:
+            tasks = [(i, [classes[name] for name in pairing.names], seed, pair)
+                     for i, pairing in enumerate(running)
+                     for pair in range(pairing.pairs, min(pairing.pairs + batch_size, max_pairs))]
+            done = pool.imap(_play_pair, tasks) if pool else map(_play_pair, tasks)
+            for i, _, results in done:
+                pairing = running[i]
+                if pairing.done:
+                    # decided earlier in this batch, later pairs are not counted
+                    continue
+                pairing.add(results, sprt)
+                pairing.done = pairing.done or pairing.pairs >= max_pairs
+                if progress:
+                    progress(pairing)
+            running = [pairing for pairing in running if not pairing.done]
+    finally:
+        if pool:
+            pool.terminate()
+    return seed, all_pairings
+
+def format_elo(value):
+    return "{:+.0f}".format(value + 0.0) if np.isfinite(value) else ("+inf" if value > 0 else "-inf")
+
+def format_pairing(pairing):
+    row = pairing.as_dict()
+    decision = {'H1': "H1 accepted", 'H0': "H0 accepted", None: "undecided"}[row['decision']]
+    return ("  {:<12} vs {:<12} {:>5} games  W/D/L {}/{}/{}  score {:5.1%}  "
+            "Elo {} [{}, {}]  LLR {:+.2f}  {}".format(
+                row['players'][0], row['players'][1], row['games'],
+                row['wins'], row['draws'], row['losses'], row['score'],
+                format_elo(row['elo']), format_elo(row['elo_low']), format_elo(row['elo_high']),
+                row['llr'], decision))
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Play computer players in paired games until an SPRT decides every pairing")
+    parser.add_argument('players', nargs='+', help="two or more of: " + ", ".join(PLAYERS))
+    parser.add_argument('--gauntlet', action='store_true',
+                        help="play the first player against each other one instead of a round robin")
+    parser.add_argument('--elo0', type=float, default=0.0, help="Elo difference of H0")
+    parser.add_argument('--elo1', type=float, default=30.0, help="Elo difference of H1")
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('--max-games', type=int, default=2000,
+                        help="stop a pairing undecided after this many games")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="default: all cores")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    if len(args.players) < 2:
+        parser.error("at least two players are needed")
+    for name in args.players:
+        player_class(name)
+    sprt = SPRT(args.elo0, args.elo1, args.alpha, args.beta)
+    print("SPRT elo0 {:+.0f} elo1 {:+.0f} alpha {} beta {}, LLR bounds [{:.2f}, {:.2f}]".format(
+        args.elo0, args.elo1, args.alpha, args.beta, sprt.lower, sprt.upper))
+    start = time.perf_counter()
+    seed, results = run_tournament(
+        args.players, args.gauntlet, sprt, max(1, args.max_games // 2), args.workers, args.seed)
+    games = sum(2 * pairing.pairs for pairing in results)
+    print("{} games in {:.1f} s, seed {}".format(games, time.perf_counter() - start, seed))
+    for pairing in results:
+        print(format_pairing(pairing))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# Fit the weights of Learned_Player from game logs.
+# Usage:
+#   python simulate.py heuristic heuristic --games 5000 --record selfplay.azlog
+#   python train.py selfplay.azlog --out learned_weights.npz
+# Every position of every game is a training example, its target is the
+# final score difference for the player to move.  A linear ValueModel is fit
+# by ridge regression, accumulating the normal equations batch by batch so
+# memory does not grow with the number of games.
+import argparse
+
+import numpy as np
+
+from constants import *
+from features import Encoder, NUM_FEATURES, BIAS
+from gamelog import GameLogReader
+from learned import ValueModel, DEFAULT_WEIGHTS
+from replay import iter_positions
+from state import State, STATE_SIZE, STATE_DTYPE, NEXT_PLAYER
+
+def game_examples(record):
+    # State data of every position of a GameRecord and the targets
+    num_plies = sum(len(round.moves) for round in record.rounds)
+    states = np.empty((num_plies + 1, STATE_SIZE), dtype=STATE_DTYPE)
+    for ply, model in iter_positions(record):
+        State.from_model(model, states[ply])
+    players = states[:, NEXT_PLAYER]
+    scores = np.array(record.scores)
+    return states, scores[players] - scores[1 - players]
+
+class RidgeFit:
+    # Normal equations of a ridge regression, accumulated over batches
+    def __init__(self, num_features):
+        self.xtx = np.zeros((num_features, num_features))
+        self.xty = np.zeros(num_features)
+        self.yty = 0.0
+        self.count = 0
+
+    def add(self, x, y):
+        x = x.astype(np.float64)
+        self.xtx += x.T @ x
+        self.xty += x.T @ y
+        self.yty += float(y @ y)
+        self.count += len(y)
+
+    def solve(self, ridge):
+        # Return the weights and their root mean squared error on the data.
+        # ridge is the L2 penalty per example, the bias is not penalized.
+        penalty = np.full(len(self.xty), ridge * self.count)
+        penalty[BIAS] = 0
+        weights = np.linalg.solve(self.xtx + np.diag(penalty), self.xty)
+        sse = self.yty - 2 * weights @ self.xty + weights @ self.xtx @ weights
+        return weights, float(np.sqrt(max(sse, 0) / self.count))
+
+def fit(paths, ridge=0.05, max_games=None, batch_size=10000):
+    # Fit a linear ValueModel on the games in the logs at paths.
+    # Return the model and the training statistics.
+    encoder = Encoder(batch_size)
+    ridge_fit = RidgeFit(NUM_FEATURES)
+    games = 0
+    states, targets = [], []
+    def flush():
+        ridge_fit.add(encoder.encode(np.concatenate(states)), np.concatenate(targets))
+        states.clear()
+        targets.clear()
+    for path in paths:
+        with GameLogReader(path) as log:
+            for record in log:
+                if max_games is not None and games >= max_games:
+                    break
+                game_states, game_targets = game_examples(record)
+                states.append(game_states)
+                targets.append(game_targets)
+                games += 1
+                if sum(len(s) for s in states) >= batch_size:
+                    flush()
+    if states:
+        flush()
+    if not ridge_fit.count:
+        raise ValueError("No games in {}".format(", ".join(paths)))
+    weights, rmse = ridge_fit.solve(ridge)
+    stats = {'games': games, 'positions': ridge_fit.count, 'rmse': rmse}
+    return ValueModel([weights[:, None]]), stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit Learned_Player's weights from game logs")
+    parser.add_argument('logs', nargs='+')
+    parser.add_argument('--out', default=DEFAULT_WEIGHTS)
+    parser.add_argument('--ridge', type=float, default=0.05,
+                        help="L2 penalty of the weights per position")
+    parser.add_argument('--max-games', type=int, default=None)
+    args = parser.parse_args()
+    value_model, stats = fit(args.logs, args.ridge, args.max_games)
+    value_model.save(args.out)
+    print("{games} games, {positions} positions, rmse {rmse:.2f}".format(**stats))
+    print("weights written to {}".format(args.out))
+
+if __name__ == '__main__':
+    main()
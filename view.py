@@ -196,6 +196,8 @@ class CenterBoard(tk.Frame):
 		super().__init__(bg=BOARD_BG)
 		self.factories = self.init_factories()
 		self.center = self.init_center()
+		# (canvas, tile index) of the highlighted tiles
+		self.selected = []
 
 	def init_factories(self):
 		factories = []
@@ -209,13 +211,20 @@ class CenterBoard(tk.Frame):
 		color = clicked_canvas.itemcget(tile_index, "fill")
 		if color in [BOARD_BG, 'white']:
 			return
-		for canvas in self.factories + [self.center]:
-			for idx in canvas.find_withtag("tile"):
-				if float(canvas.itemcget(idx, "width")) > 1:
-					canvas.itemconfig(idx, width=1)
-					continue
-				if canvas == clicked_canvas and canvas.itemcget(idx, "fill") in [color, 'white']:
-					canvas.itemconfig(idx, width=BOLD_WIDTH)
+		# clicking the selected tiles again unselects them
+		was_selected = (clicked_canvas, tile_index) in self.selected
+		self.clear_selection()
+		if was_selected:
+			return
+		for idx in clicked_canvas.find_withtag("tile"):
+			if clicked_canvas.itemcget(idx, "fill") in [color, 'white']:
+				clicked_canvas.itemconfig(idx, width=BOLD_WIDTH)
+				self.selected.append((clicked_canvas, idx))
+
+	def clear_selection(self):
+		for canvas, idx in self.selected:
+			canvas.itemconfig(idx, width=1)
+		self.selected = []
 
 	def create_center_tile(self, canvas, row, col):
 		x0, y0 = PADDING + col*(TILE_SIZE+PADDING), PADDING + row*(TILE_SIZE+PADDING)
@@ -248,6 +257,7 @@ class Menu(tk.Menu):
 		game_menu = tk.Menu(self, tearoff=0)
 		game_menu.add_command(label="vs Person")
 		game_menu.add_command(label="vs Computer")
+		game_menu.add_command(label="Computer vs Computer")
 		return game_menu
 
 	def add_vs_person_command(self, func):
@@ -256,6 +266,37 @@ class Menu(tk.Menu):
 	def add_vs_computer_command(self, func):
 		self.game_menu.entryconfig(1, command=func)
 
+	def add_computer_vs_computer_command(self, func):
+		self.game_menu.entryconfig(2, command=func)
+
+class ComputerGameDialog(tk.Toplevel):
+	# Choose the player of every seat and the playback speed.
+	# func(player_names, speed) is called with the choices on Start.
+	def __init__(self, master, player_names, speeds, func):
+		super().__init__(master, bg=BOARD_BG)
+		self.title("Computer vs Computer")
+		self.func = func
+		self.players = []
+		for player in range(NUM_PLAYERS):
+			tk.Label(self, text="Player {}".format(player), bg=BOARD_BG).grid(row=player, column=0, sticky='w')
+			choice = tk.StringVar(self, player_names[0])
+			tk.OptionMenu(self, choice, *player_names).grid(row=player, column=1, sticky='ew')
+			self.players.append(choice)
+		tk.Label(self, text="Speed", bg=BOARD_BG).grid(row=NUM_PLAYERS, column=0, sticky='w')
+		self.speed = tk.StringVar(self, speeds[0])
+		tk.OptionMenu(self, self.speed, *speeds).grid(row=NUM_PLAYERS, column=1, sticky='ew')
+		tk.Button(self, text="Start", command=self.start).grid(row=NUM_PLAYERS+1, column=0, columnspan=2)
+		self.transient(master)
+		# a window which is not mapped yet can not grab on X11
+		self.wait_visibility()
+		self.grab_set()
+
+	def start(self):
+		names = [choice.get() for choice in self.players]
+		speed = self.speed.get()
+		self.destroy()
+		self.func(names, speed)
+
 class View(tk.Frame):
 	def __init__(self, master):
 		self.menu = Menu(master)
@@ -265,6 +306,11 @@ class View(tk.Frame):
 		self.boards[0].grid(row=0, column=0, padx=2, pady=2)
 		self.boards[1].grid(row=1, column=0, padx=2, pady=2)
 		self.centerboard.grid(row=0, column=1, rowspan=2, padx=2, pady=2)
+		self.status = tk.Label(bg=BOARD_BG, anchor='w')
+		self.status.grid(row=2, column=0, columnspan=2, sticky='ew')
+
+	def clear_selection(self):
+		self.centerboard.clear_selection()
 
 	def selected_factory(self):
 		# return the index of the factory which has selected tiles
@@ -0,0 +1,125 @@
+# Zobrist hashing of Azul positions and a transposition table.
+# The hash of a position is the XOR of one random 64-bit key for every
+# component: each wall cell, each pattern line's tile and count, each floor
+# line's count and first player tile, each player's score, the count of every
+# tile type in the center, and the side to move, XORed with the factory key.
+# The factory key is the sum modulo 2**64 of a key for the tiles in each
+# factory, which does not depend on the order of the factories, so positions
+# which differ only in the order of their factories hash the same.
+# Keys for a count of 0 are 0, so empty piles do not contribute.
+from collections import namedtuple
+
+import numpy as np
+
+from constants import *
+
+MAX_PILE = NUM_FACTORIES * TILES_PER_FACTORY + 1 # most tiles one pile can hold in a round
+MAX_SCORE = 512
+NUM_TILE_TYPES = NUM_TILES + 1
+WHITE = NUM_TILE_TYPES # Tile.white.value
+
+def _keys(rng, shape, zero_counts=True):
+    keys = rng.integers(1, 2**64, size=shape, dtype=np.uint64, endpoint=False)
+    if zero_counts:
+        keys[..., 0] = 0
+    return keys.tolist()
+
+_rng = np.random.default_rng(0x5a17)
+WALL_KEYS = _keys(_rng, (NUM_PLAYERS, NUM_TILES, NUM_TILES), zero_counts=False)
+LINE_KEYS = _keys(_rng, (NUM_PLAYERS, NUM_TILES, NUM_TILE_TYPES + 1, NUM_TILES + 1))
+FLOOR_KEYS = _keys(_rng, (NUM_PLAYERS, MAX_PILE + 1))
+FLOOR_WHITE_KEYS = _keys(_rng, (NUM_PLAYERS,), zero_counts=False)
+SCORE_KEYS = _keys(_rng, (NUM_PLAYERS, MAX_SCORE))
+FACTORY_KEYS = _keys(_rng, (NUM_TILE_TYPES + 1, TILES_PER_FACTORY + 1))
+CENTER_KEYS = _keys(_rng, (NUM_TILE_TYPES + 1, MAX_PILE + 1))
+SIDE_KEYS = _keys(_rng, (NUM_PLAYERS,))
+
+def pile_key(keys, tiles):
+    # Key of a factory or the center holding tiles.  keys[tile value][count]
+    counts = [0] * (NUM_TILE_TYPES + 1)
+    for tile in tiles:
+        counts[tile.value] += 1
+    key = 0
+    for value, count in enumerate(counts):
+        key ^= keys[value][count]
+    return key
+
+def line_key(player, row, line):
+    return LINE_KEYS[player][row][line.tile.value if line.tile else 0][line.num]
+
+def floor_key(player, floor_line):
+    key = FLOOR_KEYS[player][min(len(floor_line), MAX_PILE)]
+    for tile in floor_line:
+        if tile.value == WHITE:
+            key ^= FLOOR_WHITE_KEYS[player]
+    return key
+
+def board_key(player, board):
+    key = SCORE_KEYS[player][min(int(board.score), MAX_SCORE - 1)]
+    for row, col in zip(*np.nonzero(board.wall)):
+        key ^= WALL_KEYS[player][row][col]
+    for row, line in enumerate(board.pattern_lines):
+        key ^= line_key(player, row, line)
+    return key ^ floor_key(player, board.floor_line)
+
+def model_key(model):
+    # Hash of model computed from scratch, without the factories
+    key = SIDE_KEYS[model.next_player]
+    for player, board in enumerate(model.boards):
+        key ^= board_key(player, board)
+    return key ^ pile_key(CENTER_KEYS, model.center)
+
+def factory_key(factories):
+    # Factory key of a list of factories
+    return sum(pile_key(FACTORY_KEYS, factory) for factory in factories) % 2**64
+
+def move_key(model, move):
+    # XOR of the keys of the components of model that move changes, apart
+    # from the side to move and the factories.  XORing this before and after
+    # make_move updates the hash incrementally.
+    player = model.next_player
+    board = model.boards[player]
+    key = pile_key(CENTER_KEYS, model.center) ^ floor_key(player, board.floor_line)
+    if not move.to_floor_line():
+        key ^= line_key(player, move.pattern_line, board.pattern_lines[move.pattern_line])
+    return key
+
+# flag tells how value relates to the true value of the position
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+TTEntry = namedtuple('TTEntry', ['depth', 'value', 'flag', 'move', 'generation'])
+
+class TranspositionTable:
+    # A fixed size table of search results indexed by Zobrist hash.
+    # Every hash maps to one slot.  A new entry replaces the one in its slot
+    # if it was searched at least as deep, or if the old entry is from an
+    # earlier search (call new_search before every search).
+    def __init__(self, size=2**20):
+        self.size = size
+        self.keys = [None] * size
+        self.entries = [None] * size
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def new_search(self):
+        self.generation += 1
+
+    def probe(self, key):
+        # Return the TTEntry stored for key, or None
+        self.probes += 1
+        slot = key % self.size
+        if self.keys[slot] == key:
+            self.hits += 1
+            return self.entries[slot]
+        return None
+
+    def store(self, key, depth, value, flag, move=None):
+        slot = key % self.size
+        old = self.entries[slot]
+        if old is None or depth >= old.depth or old.generation != self.generation:
+            self.keys[slot] = key
+            self.entries[slot] = TTEntry(depth, value, flag, move, self.generation)
+
+    def clear(self):
+        self.keys = [None] * self.size
+        self.entries = [None] * self.size